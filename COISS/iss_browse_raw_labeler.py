@@ -1,10 +1,11 @@
 from __future__ import print_function
 import os,sys
-import hashlib
 import pdsparser
 import vicar
 import time, pytz, datetime
 import traceback
+from multiprocessing.pool import ThreadPool
+import digest_store
 
 TEMPLATE = 'cassini-iss-preview-template-20190602.xml'
 
@@ -46,17 +47,75 @@ for k,section in enumerate(SECTIONS):
 
 ################################################################################
 
-# From http://stackoverflow.com/questions/3431825/-
-#       generating-an-md5-checksum-of-a-file
+# Checksums of browse images
+#
+# hashlib releases the GIL while it digests a large buffer, so the images are
+# hashed in parallel threads before labeling begins. Each checksum is saved in
+# the digest store against the file's size and modification time, so a later
+# run reads only the images that have changed.
+################################################################################
+
+HASH_BLOCKSIZE = 4 * 1048576
+HASH_THREADS = 8
+HASH_SAVE_BATCH = 256       # checksums saved per digest store transaction
+
+# Checksums computed in this run, keyed by file path
+CHECKSUMS = {}
+
+def _md5_pair(fname):
+    """Return (file path, MD5 checksum), or (file path, None) if the file
+    cannot be read; the error is then reported when the file is labeled."""
+
+    try:
+        return (fname, digest_store.file_md5(fname, HASH_BLOCKSIZE))
+    except (IOError, OSError):
+        return (fname, None)
+
+def hash_files(fnames, threads=HASH_THREADS):
+    """Compute the MD5 checksums of a list of files in parallel threads,
+    skipping those already saved in the digest store. Results are kept in
+    CHECKSUMS and saved in the digest store from this thread, because a sqlite
+    connection cannot be shared between threads."""
+
+    todo = []
+    for fname in fnames:
+        md5 = digest_store.lookup(fname)
+        if md5:
+            CHECKSUMS[fname] = md5
+        else:
+            todo.append(fname)
+
+    unsaved = []
+    pool = ThreadPool(threads)
+    try:
+        for (fname, md5) in pool.imap_unordered(_md5_pair, todo):
+            if md5 is None:
+                continue
 
-def hashfile(fname, blocksize=65536):
-    f = open(fname, 'rb')
-    hasher = hashlib.md5()
-    buf = f.read(blocksize)
-    while len(buf) > 0:
-        hasher.update(buf)
-        buf = f.read(blocksize)
-    return hasher.hexdigest()
+            CHECKSUMS[fname] = md5
+            unsaved.append((fname, md5))
+            if len(unsaved) >= HASH_SAVE_BATCH:
+                digest_store.save_many(unsaved)
+                unsaved = []
+    except BaseException:
+        pool.terminate()
+        pool.join()
+        raise
+
+    pool.close()
+    pool.join()
+
+    if unsaved:
+        digest_store.save_many(unsaved)
+
+def hashfile(fname, blocksize=HASH_BLOCKSIZE):
+    """Return the MD5 checksum of a file, reading it only if its checksum is
+    not already known."""
+
+    if fname in CHECKSUMS:
+        return CHECKSUMS[fname]
+
+    return digest_store.md5(fname, blocksize)
 
 ################################################################################
 
@@ -87,7 +146,7 @@ def write_pds4_label(png_filename):
     utc_dt = local_dt.astimezone(pytz.utc)
     creation_date = utc_dt.strftime('%Y-%m-%dT%H:%M:%S')
 
-    md5_checksum = hashfile(png_filename, blocksize=65536)
+    md5_checksum = hashfile(png_filename)
 
     # Shift these locals to the global namespace
     globals()['basename'         ] = basename
@@ -121,7 +180,7 @@ def write_pds4_label(png_filename):
                                                    null_value=result)
 
     # Write the label
-    outfile = pds4_datafile[:-4] + '.xml'
+    outfile = png_filename[:-4] + '.xml'
     with open(outfile, 'w') as f:
         f.write(''.join(filled_out))
 
@@ -163,27 +222,38 @@ def main():
     else:
         replace = False
 
-    # Step through the args
+    # Gather the images to label
+    png_files = []
     for arg in args:
 
         # Case 1: Label a single image
         if os.path.isfile(arg):
           if arg.endswith('_full.png'):
-            label1(arg, replace)
+            png_files.append(os.path.abspath(arg))
 
         # Case 2: Label all the images in a directory tree, recursively
         elif os.path.isdir(arg):
-          prev_root = ''
           for root, dirs, files in os.walk(os.path.join(arg)):
             for name in files:
               if name.endswith('_full.png'):
+                png_files.append(os.path.abspath(os.path.join(root, name)))
+
+    if not replace:
+        png_files = [f for f in png_files
+                     if not os.path.exists(f[:-4] + '.xml')]
+
+    # Hash the images first, in parallel
+    hash_files(png_files)
 
-                if root != prev_root:
-                    print(root)
-                    prev_root = root
+    # Label the images
+    prev_root = ''
+    for filename in png_files:
+        root = os.path.dirname(filename)
+        if root != prev_root:
+            print(root)
+            prev_root = root
 
-                filename = os.path.join(root, name)
-                label1(filename, replace)
+        label1(filename, replace)
 
 if __name__ == '__main__': main()
 
@@ -4,7 +4,7 @@
 # Create XML labels for the PDS4-reformatted Cassini ISS images.
 #
 # Syntax:
-#   python iss_data_raw_labeler.py [--replace] path [path ...]
+#   python iss_data_raw_labeler.py [--replace | --changed] path [path ...]
 #
 # A label will be created for each image file ("*.img") found in each given
 # path, recursively. This can be any combination of directories and individual
@@ -12,24 +12,124 @@
 #
 # Use "--replace" to replace pre-existing labels. Otherwise, labels will only be
 # generated for images that currently lack labels.
+#
+# Use "--changed" to replace only the labels whose inputs have changed since
+# they were generated: the template, the lookup tables, the PDS3 label or the
+# image file. The first run with "--changed" regenerates every label.
 ################################################################################
 
 import os,sys
+import re
+import sqlite3
+import inspect
 import pdsparser
 import vicar
 import traceback
+from multiprocessing import Pool, cpu_count
 from xmltemplate import XmlTemplate
+from target_matcher import TargetMatcher
+import label_cache
+import label_inputs
 
 from SOLAR_SYSTEM_TARGETS import SOLAR_SYSTEM_TARGETS
 
 TEMPLATE = XmlTemplate('iss_data_raw_template.xml')
 
-PDS3_FILEPATHS = {}
-for filename in ['COISS_1xxx.lis', 'COISS_2xxx.lis']:
-    with open(filename) as f:
-        for rec in f:
-            key = rec[39:49] + rec[38].lower() + '.img'
-            PDS3_FILEPATHS[key] = rec.rstrip()
+################################################################################
+# Index of PDS3 file paths, keyed by the basename of the PDS4 image file
+################################################################################
+
+PDS3_LISTS = ['COISS_1xxx.lis', 'COISS_2xxx.lis']
+PDS3_INDEX_PATH = 'iss_pds3_filepaths.db'
+
+PDS3_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS filepaths (
+    basename    TEXT PRIMARY KEY,
+    filepath    TEXT
+);
+CREATE TABLE IF NOT EXISTS sources (
+    listfile    TEXT PRIMARY KEY,
+    size        INTEGER,
+    mtime       REAL
+);
+"""
+
+class Pds3FilepathIndex(object):
+    """Read-only dictionary of PDS3 file paths, stored in a sqlite file.
+
+    The index is built from the list files the first time it is used, and is
+    rebuilt whenever one of the list files has changed. Nothing is read until
+    the first lookup.
+    """
+
+    def __init__(self, lists, db_path):
+        self.lists = lists
+        self.db_path = db_path
+        self.connection = None
+        self.pid = None
+
+    def _open(self):
+        """Open the index in this process, rebuilding it if necessary."""
+
+        self.connection = sqlite3.connect(self.db_path, timeout=60.)
+        self.connection.executescript(PDS3_INDEX_SCHEMA)
+        self.pid = os.getpid()
+
+        if self._is_current():
+            return
+
+        # Lock the database, then check again in case another process has just
+        # rebuilt it
+        cursor = self.connection.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        if self._is_current():
+            self.connection.commit()
+            return
+
+        cursor.execute('DELETE FROM filepaths')
+        cursor.execute('DELETE FROM sources')
+        for filename in self.lists:
+            with open(filename) as f:
+                records = [(rec[39:49] + rec[38].lower() + '.img', rec.rstrip())
+                           for rec in f]
+
+            cursor.executemany('INSERT OR REPLACE INTO filepaths '
+                               'VALUES (?,?)', records)
+
+            stat = os.stat(filename)
+            cursor.execute('INSERT INTO sources VALUES (?,?,?)',
+                           (filename, stat.st_size, stat.st_mtime))
+
+        self.connection.commit()
+
+    def _is_current(self):
+        """True if the index was built from the current list files."""
+
+        rows = self.connection.execute('SELECT listfile, size, mtime '
+                                       'FROM sources').fetchall()
+        saved = {r[0]:tuple(r[1:]) for r in rows}
+        for filename in self.lists:
+            stat = os.stat(filename)
+            if saved.get(filename) != (stat.st_size, stat.st_mtime):
+                return False
+
+        return len(saved) == len(self.lists)
+
+    def __getitem__(self, basename):
+
+        # A sqlite connection cannot be used across a fork
+        if self.connection is None or self.pid != os.getpid():
+            self._open()
+
+        row = self.connection.execute('SELECT filepath FROM filepaths '
+                                      'WHERE basename=?',
+                                      (basename,)).fetchone()
+        if row is None:
+            raise KeyError(basename)
+
+        return str(row[0])
+
+PDS3_FILEPATHS = Pds3FilepathIndex(PDS3_LISTS, PDS3_INDEX_PATH)
 
 ################################################################################
 
@@ -225,6 +325,11 @@ for (name, alts, lid) in STAR_ABBREVS.values():
     TARGET_DICT[name.upper()] = (name, alts, 'Star', 'N/A',
                                  'urn:nasa:pds:context:target:star.%s' % lid)
 
+# Find all the star abbreviations within a string in a single scan
+STAR_MATCHER_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'iss_star_matcher.pickle')
+STAR_MATCHER = TargetMatcher.cached(STAR_ABBREVS.keys(), STAR_MATCHER_CACHE)
+
 def iss_target_info(target_name, target_desc, observation_id, shutter_mode_id,
                     sequence_title, filename):
 
@@ -266,9 +371,8 @@ def iss_target_info(target_name, target_desc, observation_id, shutter_mode_id,
         target_keys.add('Saturn Rings')
 
     # Star IDs are sometimes encoded in the OBSERVATION_ID
-    for (key,value) in STAR_ABBREVS.items():
-        if key in obs_id or key in sequence_title:
-            target_keys.add(value[0])
+    for key in STAR_MATCHER.matches(obs_id, sequence_title):
+        target_keys.add(STAR_ABBREVS[key][0])
 
     # If our set is not empty, we're done:
     if len(target_keys) and shutter_mode_id != 'DISABLED':
@@ -494,6 +598,21 @@ def iss_purpose(image_observation_type, observation_id):
 
 ################################################################################
 
+def read_pds3_label(pds3_label):
+    """Read and parse a PDS3 label, fixing known syntax errors."""
+
+    label_text = open(pds3_label).read()
+    label_text = label_text.replace('../../label/','')
+    label_text = label_text.replace(' N/A\r\n', ' "N/A"\r\n')
+    label_text = label_text.replace('0000-000T00:00:00.000', 'INVALID_DATE')
+    label_text = label_text.replace('\r','') # pyparsing is not set up for <CR>
+
+    label = pdsparser.PdsLabel.from_string(label_text).as_dict()
+    if label['EARTH_RECEIVED_START_TIME'] == 'INVALID_DATE':    # known error
+        label['EARTH_RECEIVED_START_TIME'] = '0000-000T00:00:00.000'
+
+    return label
+
 PREV_MISSION_PHASE_NAME = None
 
 def write_pds4_label(datafile, pds3_label):
@@ -510,16 +629,8 @@ def write_pds4_label(datafile, pds3_label):
 
         return naif_id
 
-    # Read the PDS3 label and the VICAR header, fixing known syntax errors
-    label_text = open(pds3_label).read()
-    label_text = label_text.replace('../../label/','')
-    label_text = label_text.replace(' N/A\r\n', ' "N/A"\r\n')
-    label_text = label_text.replace('0000-000T00:00:00.000', 'INVALID_DATE')
-    label_text = label_text.replace('\r','') # pyparsing is not set up for <CR>
-
-    label = pdsparser.PdsLabel.from_string(label_text).as_dict()
-    if label['EARTH_RECEIVED_START_TIME'] == 'INVALID_DATE':    # known error
-        label['EARTH_RECEIVED_START_TIME'] = '0000-000T00:00:00.000'
+    # Read the PDS3 label and the VICAR header
+    label = label_cache.label_dict(pds3_label, read_pds3_label)
 
     vicar_image = vicar.VicarImage.from_file(datafile)
     header = vicar_image.as_dict()
@@ -598,22 +709,53 @@ def write_pds4_label(datafile, pds3_label):
 # Command line interface
 ################################################################################
 
-def label1(pds4_file, replace=False):
+def pds3_label_path(pds4_file):
+    """Return the path to the PDS3 label of a PDS4 image file."""
+
+    parts = pds4_file.split('/data_raw/')
+    if len(parts) != 2:
+        raise ValueError('not in a data_raw directory: ' + pds4_file)
+
+    return parts[0] + '/pds3-labels/' + parts[1][:-3] + 'lbl'
+
+# Files, besides the template, whose contents determine every label
+LOOKUP_TABLES = ['iss_data_raw_labeler.py', 'SOLAR_SYSTEM_TARGETS.py'] + \
+                PDS3_LISTS + \
+                [inspect.getsourcefile(obj) for obj in (XmlTemplate,
+                                                        TargetMatcher,
+                                                        label_cache)]
+
+def product_inputs(pds4_file, pds3_label):
+    """Return the hash of the inputs to the label of one image."""
+
+    return label_inputs.inputs_hash([TEMPLATE.filename] + LOOKUP_TABLES +
+                                    [pds3_label, pds4_file],
+                                    [PREV_MISSION_PHASE_NAME])
+
+def label1(pds4_file, replace=False, changed=False):
     """Generate one label file, replacing a pre-existing one only if necessary.
     """
 
     try:
         pds4_file = os.path.abspath(pds4_file)
-        if not replace and os.path.exists(pds4_file[:-4] + '.xml'):
+        labelfile = pds4_file[:-4] + '.xml'
+        if not (replace or changed) and os.path.exists(labelfile):
             return
 
-        parts = pds4_file.split('/data_raw/')
-        pds3_label = parts[0] + '/pds3-labels/' + parts[1][:-3] + 'lbl'
+        pds3_label = pds3_label_path(pds4_file)
+        if changed:
+            inputs = product_inputs(pds4_file, pds3_label)
+            if label_inputs.is_current(labelfile, inputs):
+                return
 
+        parts = pds4_file.split('/data_raw/')
         print('data_raw/' + parts[1])
 
         write_pds4_label(pds4_file, pds3_label)
 
+        if changed:
+            label_inputs.save(labelfile, inputs)
+
     # A KeyboardInterrupt must stop the program
     except KeyboardInterrupt:
         sys.exit(1)
@@ -625,8 +767,77 @@ def label1(pds4_file, replace=False):
         (etype, value, tb) = sys.exc_info()
         print(''.join(traceback.format_tb(tb)))
 
+################################################################################
+# Mission phase pre-pass
+################################################################################
+
+MISSION_PHASE_REGEX = re.compile(r'^\s*MISSION_PHASE_NAME\s*=\s*'
+                                 r'(?:"([^"]*)"|(\S*))', re.M)
+
+def mission_phase_name(pds4_file):
+    """Return the MISSION_PHASE_NAME from the PDS3 label of an image, read
+    without a full parse of the label; None if the label cannot be read."""
+
+    try:
+        with open(pds3_label_path(pds4_file)) as f:
+            label_text = f.read()
+
+    # A missing label is reported when the image is labeled
+    except IOError:
+        return None
+
+    # For any other exception, print an error message and keep going
+    except Exception as e:
+        print('*** error for: ', pds4_file)
+        print(e)
+        (etype, value, tb) = sys.exc_info()
+        print(''.join(traceback.format_tb(tb)))
+        return None
+
+    match = MISSION_PHASE_REGEX.search(label_text)
+    if match is None:
+        return None
+
+    if match.group(1) is not None:
+        return match.group(1)
+
+    return match.group(2)
+
+def prev_mission_phase_names(pds4_files, pool):
+    """Return, for each image in the order given, the value that the global
+    PREV_MISSION_PHASE_NAME would have when the image is labeled in a
+    sequential run over the same list."""
+
+    names = pool.map(mission_phase_name, pds4_files, chunksize=64)
+
+    prevs = []
+    prev = None
+    for name in names:
+        prevs.append(prev)
+        if name is not None and name.strip():
+            prev = name
+
+    return prevs
+
+def label1_after(pds4_file, prev_mission_phase_name, replace=False,
+                 changed=False):
+    """Generate one label file, first restoring the mission phase carried over
+    from the previous image."""
+
+    global PREV_MISSION_PHASE_NAME
+
+    PREV_MISSION_PHASE_NAME = prev_mission_phase_name
+    label1(pds4_file, replace, changed)
+
+def _label1_after(args):
+    return label1_after(*args)
+
 ### MAIN PROGRAM
 
+# Number of worker processes; each worker imports this module and so keeps its
+# own copy of TEMPLATE, already compiled, for the whole run.
+PROCESSES = cpu_count()
+
 def main():
 
     # Get the command line args
@@ -639,22 +850,49 @@ def main():
     else:
         replace = False
 
-    # Step through the args
+    # Set the changed flag if it's in the argument list
+    if '--changed' in args:
+        changed = True
+        args.remove('--changed')
+    else:
+        changed = False
+
+    # Gather the images to label, in the order of a sequential run
+    pds4_files = []
     for arg in args:
 
         # Case 1: Label a single image
         if os.path.isfile(arg):
           if arg.endswith('.img'):
-            label1(arg, replace)
+            pds4_files.append(os.path.abspath(arg))
 
         # Case 2: Label all the images in a directory tree, recursively
         elif os.path.isdir(arg):
           for root, dirs, files in os.walk(os.path.join(arg)):
             for name in files:
               if name.endswith('.img'):
+                pds4_files.append(os.path.abspath(os.path.join(root, name)))
+
+    # Images that already have labels are skipped, so they carry nothing over
+    if not replace and not changed:
+        pds4_files = [f for f in pds4_files
+                      if not os.path.exists(f[:-4] + '.xml')]
+
+    pool = Pool(PROCESSES)
+    try:
+        # An image with a blank MISSION_PHASE_NAME inherits the value of the
+        # previous image; work these out first so the images are independent
+        prevs = prev_mission_phase_names(pds4_files, pool)
+
+        # Label the images in parallel
+        pool.map(_label1_after, [(f, p, replace, changed) for (f,p)
+                                 in zip(pds4_files, prevs)], chunksize=16)
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        sys.exit(1)
 
-                filename = os.path.join(root, name)
-                label1(filename, replace)
+    pool.join()
 
 if __name__ == '__main__': main()
 
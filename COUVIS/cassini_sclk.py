@@ -1,3 +1,20 @@
+################################################################################
+# cassini_sclk.py
+#
+# Tabulate the difference between the Cassini spacecraft clock kernels
+# cas00171.tsc and cas00172.tsc.
+#
+# Syntax:
+#   python cassini_sclk.py [--benchmark [count]]
+#
+# The conversions are provided as pairs of functions: a scalar version and an
+# array version ending in "_array", which converts an entire array with one
+# call to cspyce's vectorized routines. With "--benchmark", the two versions
+# are timed against each other instead.
+################################################################################
+
+import sys
+import time
 import numpy as np
 import textkernel
 import tabulation
@@ -9,46 +26,137 @@ EOM = '2017-09-16/00:00:00'
 
 cspyce.furnsh(LSK)
 
-tk = textkernel.from_file(ROOT + 'cas00172.tsc')
-coeffts = np.array(tk['SCLK'][1]['COEFFICIENTS_82']).reshape(-1,3)
-sclk = (coeffts[:,0] + tk['SCLK_PARTITION_START_82']) / 256.
-tdt = coeffts[:,1]
-tdb = [cspyce.unitim(t,'TDT','TDB') for t in tdt]
-
-tdb_end = cspyce.utc2et(EOM)
-tdt_end = cspyce.unitim(tdb_end,'TDB','TDT')
-rate_end = coeffts[-1,2]
-sclk_end = sclk[-1] + (tdt_end - tdt[-1]) / rate_end
-
-sclk = np.array(list(sclk) + [sclk_end])
-tdb  = np.array(list(tdb)  + [tdb_end])
-cas00172 = tabulation.Tabulation(tdb, sclk)
-
-tk = textkernel.from_file(ROOT + 'cas00171.tsc')
-coeffts = np.array(tk['SCLK'][1]['COEFFICIENTS_82']).reshape(-1,3)
-sclk = (coeffts[:,0] + tk['SCLK_PARTITION_START_82']) / 256.
-tdt = coeffts[:,1]
-tdb = [cspyce.unitim(t,'TDT','TDB') for t in tdt]
-
-tdb_end = cspyce.utc2et(EOM)
-tdt_end = cspyce.unitim(tdb_end,'TDB','TDT')
-rate_end = coeffts[-1,2]
-sclk_end = sclk[-1] + (tdt_end - tdt[-1]) / rate_end
-
-sclk = np.array(list(sclk) + [sclk_end])
-tdb  = np.array(list(tdb)  + [tdb_end])
-cas00171 = tabulation.Tabulation(tdb, sclk)
-
-correction = cas00172 - cas00171
-
-print '# TDT, UTC, DOY, new-SCLK, old-SCLK, difference'
-
-for et in np.arange(0.,cspyce.utc2et(EOM), 20000.):
-    print '%9.0f' % et,
-    print cspyce.et2utc(et, 'ISOC', 6),
-    print cspyce.et2utc(et, 'ISOD', 6)[5:8],
-    print '%17.6f' % cas00172(et),
-    print '%17.6f' % cas00171(et),
-    print '%9.6f' % correction(et)
-
-pylab.plot(x[x>0]/86400./365.25 + 2000,y[x>0])
+################################################################################
+# Time conversions
+################################################################################
+
+def tdb_from_tdt(tdt):
+    """Convert a TDT time in seconds to TDB."""
+
+    return cspyce.unitim(tdt, 'TDT', 'TDB')
+
+def tdb_from_tdt_array(tdt):
+    """Convert an array of TDT times in seconds to TDB."""
+
+    return cspyce.unitim_vector(np.asarray(tdt, dtype='float'), 'TDT', 'TDB')
+
+def tdt_from_tdb(tdb):
+    """Convert a TDB time in seconds to TDT."""
+
+    return cspyce.unitim(tdb, 'TDB', 'TDT')
+
+def tdt_from_tdb_array(tdb):
+    """Convert an array of TDB times in seconds to TDT."""
+
+    return cspyce.unitim_vector(np.asarray(tdb, dtype='float'), 'TDB', 'TDT')
+
+def utc_from_et(et, format='ISOC', digits=6):
+    """Convert an ephemeris time to a UTC string."""
+
+    return cspyce.et2utc(et, format, digits)
+
+def utc_from_et_array(et, format='ISOC', digits=6):
+    """Convert an array of ephemeris times to UTC strings. cspyce has no
+    vectorized version of et2utc, so this loops over the times."""
+
+    return [cspyce.et2utc(t, format, digits) for t in et]
+
+################################################################################
+# SCLK kernels
+################################################################################
+
+def sclk_from_tdb(kernel):
+    """Return a Tabulation of SCLK seconds vs. TDB for an SCLK kernel, extended
+    to the end of mission. It can be called with a scalar or an array."""
+
+    tk = textkernel.from_file(ROOT + kernel)
+    coeffts = np.array(tk['SCLK'][1]['COEFFICIENTS_82']).reshape(-1,3)
+    sclk = (coeffts[:,0] + tk['SCLK_PARTITION_START_82']) / 256.
+    tdt = coeffts[:,1]
+    tdb = tdb_from_tdt_array(tdt)
+
+    tdb_end = cspyce.utc2et(EOM)
+    tdt_end = tdt_from_tdb(tdb_end)
+    rate_end = coeffts[-1,2]
+    sclk_end = sclk[-1] + (tdt_end - tdt[-1]) / rate_end
+
+    sclk = np.array(list(sclk) + [sclk_end])
+    tdb  = np.array(list(tdb)  + [tdb_end])
+    return tabulation.Tabulation(tdb, sclk)
+
+################################################################################
+# Benchmark
+################################################################################
+
+def benchmark(count=100000):
+    """Compare the rates of the scalar and array conversions."""
+
+    tdt = np.linspace(0., cspyce.utc2et(EOM), count)
+
+    start = time.time()
+    scalar = np.array([tdb_from_tdt(t) for t in tdt])
+    scalar_secs = time.time() - start
+
+    start = time.time()
+    batch = tdb_from_tdt_array(tdt)
+    batch_secs = time.time() - start
+
+    if not np.all(scalar == batch):
+        raise ValueError('scalar and array conversions disagree')
+
+    print '%-20s %12s %12s' % ('conversion', 'scalar/sec', 'array/sec')
+    print '%-20s %12.0f %12.0f' % ('tdb_from_tdt', count / scalar_secs,
+                                   count / batch_secs)
+
+    cas00172 = sclk_from_tdb('cas00172.tsc')
+    tdb = batch
+
+    start = time.time()
+    scalar = np.array([cas00172(t) for t in tdb])
+    scalar_secs = time.time() - start
+
+    start = time.time()
+    batch = cas00172(tdb)
+    batch_secs = time.time() - start
+
+    if not np.all(scalar == batch):
+        raise ValueError('scalar and array conversions disagree')
+
+    print '%-20s %12.0f %12.0f' % ('sclk_from_tdb', count / scalar_secs,
+                                   count / batch_secs)
+
+################################################################################
+# Main program
+################################################################################
+
+def main():
+
+    cas00172 = sclk_from_tdb('cas00172.tsc')
+    cas00171 = sclk_from_tdb('cas00171.tsc')
+    correction = cas00172 - cas00171
+
+    et = np.arange(0.,cspyce.utc2et(EOM), 20000.)
+    isoc = utc_from_et_array(et, 'ISOC', 6)
+    isod = utc_from_et_array(et, 'ISOD', 6)
+    new_sclk = cas00172(et)
+    old_sclk = cas00171(et)
+    diff = correction(et)
+
+    print '# TDT, UTC, DOY, new-SCLK, old-SCLK, difference'
+
+    for k in range(len(et)):
+        print '%9.0f' % et[k],
+        print isoc[k],
+        print isod[k][5:8],
+        print '%17.6f' % new_sclk[k],
+        print '%17.6f' % old_sclk[k],
+        print '%9.6f' % diff[k]
+
+if __name__ == '__main__':
+    if '--benchmark' in sys.argv[1:]:
+        args = sys.argv[sys.argv.index('--benchmark') + 1:]
+        benchmark(int(args[0]) if args else 100000)
+    else:
+        main()
+
+################################################################################
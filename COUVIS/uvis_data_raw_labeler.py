@@ -4,7 +4,7 @@
 # Create XML labels for the Cassini UVIS products.
 #
 # Syntax:
-#   python euv_fuv_data_raw_labeler.py [--replace] path [path ...]
+#   python euv_fuv_data_raw_labeler.py [--replace | --changed] path [path ...]
 #
 # A label will be created for each image file ("*.dat") found in each given
 # path, recursively. This can be any combination of directories and individual
@@ -12,17 +12,26 @@
 #
 # Use "--replace" to replace pre-existing labels. Otherwise, labels will only be
 # generated for images that currently lack labels.
+#
+# Use "--changed" to replace only the labels whose inputs have changed since
+# they were generated: the template for the instrument, the lookup tables, the
+# PDS3 label, the data file or its list of calibration files. The first run
+# with "--changed" regenerates every label.
 ################################################################################
 
 import os,sys
+import hashlib
+import inspect
 import numpy as np
 import pdsparser
 import vicar
 import traceback
 from xmltemplate import XmlTemplate
+from target_matcher import TargetMatcher
 import textkernel
 import tabulation
 import julian
+import label_inputs
 
 from SOLAR_SYSTEM_TARGETS import SOLAR_SYSTEM_TARGETS
 
@@ -30,13 +39,72 @@ EUV_FUV_TEMPLATE = XmlTemplate('euv_fuv_data_raw_template.xml')
 HDAC_TEMPLATE = XmlTemplate('hdac_data_raw_template.xml')
 HSP_TEMPLATE = XmlTemplate('hsp_data_raw_template.xml')
 
-with open('observation_ids.tab') as f:
-    recs = f.readlines()
+def template_for(inst):
+    """Return the template for the products of one instrument."""
+
+    if inst in ('euv', 'fuv'):
+        return EUV_FUV_TEMPLATE
+    elif inst == 'hdac':
+        return HDAC_TEMPLATE
+    else:
+        return HSP_TEMPLATE
+
+class ObservationIdTable(object):
+    """Class to look up observation IDs by the first 14 characters of a
+    product name, which give the instrument and start time. The table is read
+    from a file of "key","observation_id" records the first time it is used.
+    A single product is looked up in a dictionary; for a whole list of
+    products, the table is also held as sorted arrays, so that they can be
+    looked up with one call to np.searchsorted."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.table = None
+        self.keys = None
+        self.obs_ids = None
+
+    def load(self):
+        if self.table is not None:
+            return
+
+        table = {}
+        with open(self.filename) as f:
+            for rec in f:
+                (date, obs_id) = rec.rstrip().replace('"','').split(',')
+                table[date] = obs_id
+
+        self.table = table
+
+    def lookup_many(self, keys, default=None):
+        """Return the list of observation IDs for a list of keys, using the
+        default for any key not in the table."""
+
+        self.load()
+        if len(keys) == 0:
+            return []
+
+        # The sorted arrays are only built for batch lookups
+        if self.keys is None:
+            sorted_keys = sorted(self.table)
+            self.keys = np.array(sorted_keys)
+            self.obs_ids = np.array([self.table[key] for key in sorted_keys],
+                                    dtype='object')
+
+        keys = np.array(keys)
+        indices = np.searchsorted(self.keys, keys).clip(0, len(self.keys) - 1)
+        found = (self.keys[indices] == keys)
+        return [obs_id if ok else default
+                for (obs_id, ok) in zip(self.obs_ids[indices], found)]
+
+    def __getitem__(self, key):
+        self.load()
+        return self.table[key]
 
-OBSERVATION_IDS = {}
-for rec in recs:
-    (date, obs_id) = rec.rstrip().replace('"','').split(',')
-    OBSERVATION_IDS[date] = obs_id
+    def __contains__(self, key):
+        self.load()
+        return key in self.table
+
+OBSERVATION_IDS = ObservationIdTable('observation_ids.tab')
 
 EOM = '2017-09-16T00:00:00'
 
@@ -45,17 +113,27 @@ NEW_TAI_FROM_SCLK = None
 OLD_SCLK_FROM_TAI = None
 OLD_TAI_FROM_SCLK = None
 
-def INIT_SCLKS():
+# The kernels and how their times convert to TAI
+NEW_SCLK_KERNEL = ('cas00172.tsc', julian.tai_from_tdt)
+OLD_SCLK_KERNEL = ('cas00171.tsc', julian.tai_from_tdb)
 
-    global NEW_SCLK_FROM_TAI, NEW_TAI_FROM_SCLK
-    global OLD_SCLK_FROM_TAI, OLD_TAI_FROM_SCLK
+# Parsed (sclk, tai) tables, saved in a cache keyed by the kernel digests
+SCLK_CACHE = 'uvis_sclk_tables.npz'
+SCLK_TABLES = {}
 
-    if NEW_SCLK_FROM_TAI is not None: return
+def sclk_kernel_digest(kernel):
+    """Return a digest of an SCLK kernel file and the end of mission time."""
+
+    with open(kernel, 'rb') as f:
+        return hashlib.md5(f.read() + EOM.encode('ascii')).hexdigest()
+
+def read_sclk_table(kernel, tai_from_kernel):
+    """Return the (sclk, tai) arrays of an SCLK kernel, extended to EOM."""
 
-    tk = textkernel.from_file('cas00172.tsc')
+    tk = textkernel.from_file(kernel)
     coeffts = np.array(tk['SCLK'][1]['COEFFICIENTS_82']).reshape(-1,3)
     sclk = (coeffts[:,0] + tk['SCLK_PARTITION_START_82']) / 256.
-    tai = julian.tai_from_tdt(coeffts[:,1])
+    tai = tai_from_kernel(coeffts[:,1])
 
     tai_end = julian.tai_from_iso(EOM)
     rate_end = coeffts[-1,2]
@@ -63,25 +141,110 @@ def INIT_SCLKS():
 
     sclk = np.array(list(sclk) + [sclk_end])
     tai  = np.array(list(tai)  + [tai_end])
-    cas00172 = tabulation.Tabulation(tai, sclk)
-    NEW_SCLK_FROM_TAI = tabulation.Tabulation(tai, sclk)
-    NEW_TAI_FROM_SCLK = tabulation.Tabulation(sclk, tai)
+    return (sclk, tai)
 
-    tk = textkernel.from_file('cas00171.tsc')
-    coeffts = np.array(tk['SCLK'][1]['COEFFICIENTS_82']).reshape(-1,3)
-    sclk = (coeffts[:,0] + tk['SCLK_PARTITION_START_82']) / 256.
-    tai = julian.tai_from_tdb(coeffts[:,1])
+def load_sclk_tables():
+    """Fill in SCLK_TABLES from SCLK_CACHE, parsing any kernel whose digest
+    does not match the cache and then saving the cache again."""
 
-    tai_end = julian.tai_from_iso(EOM)
-    rate_end = coeffts[-1,2]
-    sclk_end = sclk[-1] + (tai_end - tai[-1]) / rate_end
+    cached = {}
+    if os.path.exists(SCLK_CACHE):
+        try:
+            npz = np.load(SCLK_CACHE)
+            cached = {key: npz[key] for key in npz.files}
+            npz.close()
+        except Exception:       # an unreadable cache is rebuilt
+            cached = {}
+
+    changed = False
+    for (kernel, tai_from_kernel) in (NEW_SCLK_KERNEL, OLD_SCLK_KERNEL):
+        name = os.path.basename(kernel)[:-4]
+        digest = sclk_kernel_digest(kernel)
+        if str(cached.get(name + '_digest', '')) != digest:
+            (sclk, tai) = read_sclk_table(kernel, tai_from_kernel)
+            cached[name + '_digest'] = np.array(digest)
+            cached[name + '_sclk'] = sclk
+            cached[name + '_tai'] = tai
+            changed = True
+
+        SCLK_TABLES[kernel] = (cached[name + '_sclk'], cached[name + '_tai'])
+
+    if changed:
+        np.savez(SCLK_CACHE, **cached)
 
-    sclk = np.array(list(sclk) + [sclk_end])
-    tai  = np.array(list(tai)  + [tai_end])
-    cas00171 = tabulation.Tabulation(tai, sclk)
+def INIT_SCLKS():
+
+    global NEW_SCLK_FROM_TAI, NEW_TAI_FROM_SCLK
+    global OLD_SCLK_FROM_TAI, OLD_TAI_FROM_SCLK
+
+    if NEW_SCLK_FROM_TAI is not None: return
+
+    load_sclk_tables()
+
+    (sclk, tai) = SCLK_TABLES[NEW_SCLK_KERNEL[0]]
+    NEW_SCLK_FROM_TAI = tabulation.Tabulation(tai, sclk)
+    NEW_TAI_FROM_SCLK = tabulation.Tabulation(sclk, tai)
+
+    (sclk, tai) = SCLK_TABLES[OLD_SCLK_KERNEL[0]]
     OLD_SCLK_FROM_TAI = tabulation.Tabulation(tai, sclk)
     OLD_TAI_FROM_SCLK = tabulation.Tabulation(sclk, tai)
 
+################################################################################
+# Batch SCLK conversions
+################################################################################
+
+def interpolate(x, y, x_new):
+    """Linear interpolation of a table, matching tabulation.Tabulation: the
+    value is zero outside the range of x."""
+
+    x_new = np.asarray(x_new, dtype='float')
+    hi = np.searchsorted(x, x_new).clip(1, len(x) - 1)
+    lo = hi - 1
+
+    slope = (y[hi] - y[lo]) / (x[hi] - x[lo])
+    y_new = slope * (x_new - x[lo]) + y[lo]
+    return np.where((x_new < x[0]) | (x_new > x[-1]), 0., y_new)
+
+def sclk_from_strings(sclk_strings):
+    """Convert Cassini SCLK strings "[p/]seconds.ticks" to an array of clock
+    seconds. There are 256 ticks per second."""
+
+    values = []
+    for sclk_string in sclk_strings:
+        (seconds, _, ticks) = sclk_string.split('/')[-1].partition('.')
+        values.append(int(seconds) + int(ticks or 0) / 256.)
+
+    return np.array(values)
+
+def tai_from_sclk(sclk, new=True):
+    """Convert an array of clock seconds to TAI, using the final SCLK kernel
+    if new is True; otherwise, the kernel used for the PDS3 labels."""
+
+    INIT_SCLKS()
+    (table_sclk, table_tai) = SCLK_TABLES[(NEW_SCLK_KERNEL if new else
+                                           OLD_SCLK_KERNEL)[0]]
+    return interpolate(table_sclk, table_tai, sclk)
+
+def sclk_from_tai(tai, new=True):
+    """Convert an array of TAI values to clock seconds."""
+
+    INIT_SCLKS()
+    (table_sclk, table_tai) = SCLK_TABLES[(NEW_SCLK_KERNEL if new else
+                                           OLD_SCLK_KERNEL)[0]]
+    return interpolate(table_tai, table_sclk, tai)
+
+def tdb_from_sclk_strings(sclk_strings, new=True):
+    """Convert a list of SCLK strings to an array of TDB seconds."""
+
+    return julian.tdb_from_tai(tai_from_sclk(sclk_from_strings(sclk_strings),
+                                             new))
+
+def utc_from_sclk_strings(sclk_strings, new=True, digits=3):
+    """Convert a list of SCLK strings to an array of ISO UTC strings."""
+
+    tai = tai_from_sclk(sclk_from_strings(sclk_strings), new)
+    return julian.iso_from_tai(tai, digits=digits)
+
 ################################################################################
 
 # Create a dictionary keyed by the body name in upper case
@@ -335,6 +498,11 @@ for (name, alts, lid) in STAR_ABBREVS.values():
     TARGET_DICT[name.upper()] = (name, alts, 'Star', 'N/A',
                                  'urn:nasa:pds:context:target:star.%s' % lid)
 
+# Find all the star abbreviations within a string in a single scan
+STAR_MATCHER_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'uvis_star_matcher.pickle')
+STAR_MATCHER = TargetMatcher.cached(STAR_ABBREVS.keys(), STAR_MATCHER_CACHE)
+
 TARGET_DICT['SOLAR WIND'] = ('Solar Wind', [], 'Plasma Stream', 'N/A',
                              'urn:nasa:pds:context:target:plasma_stream.solar_wind')
 
@@ -385,10 +553,9 @@ def uvis_target_info(target_name, observation_id, purpose_str, filename):
 
     # Star IDs are encoded in the OBSERVATION_ID
     named_star_found = False
-    for (key,value) in STAR_ABBREVS.items():
-        if key in observation_id:
-            target_keys.add(value[0])
-            named_star_found = True
+    for key in STAR_MATCHER.matches(observation_id):
+        target_keys.add(STAR_ABBREVS[key][0])
+        named_star_found = True
 
     # Handle 'STAR'
     if 'STAR' in target_keys and named_star_found:
@@ -457,10 +624,113 @@ def uvis_purpose(purpose_str, target_name):
 
 ################################################################################
 
+CALIBRATION_VERSIONS = ('3', '4', '5')
+
+class CalibrationIndex(object):
+    """Class to find the calibration files of UVIS data files. Each calibration
+    directory is listed once and the result is kept in memory; call refresh()
+    if the directory changes."""
+
+    def __init__(self):
+        self.directories = {}
+
+    def refresh(self, directory=None):
+        """Forget the listing of one calibration directory, or of all of them.
+        """
+
+        if directory is None:
+            self.directories.clear()
+        else:
+            self.directories.pop(directory, None)
+
+    def listing(self, directory):
+        """Return a dictionary keyed by the name of a data file, returning the
+        names of its calibration files in order of increasing version."""
+
+        if directory not in self.directories:
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                names = []
+
+            # Calibration files are named like the data file but with
+            # "_cal_<version>" inserted before the 8-character suffix
+            versions = {}
+            for name in names:
+                k = name.rfind('_cal_')
+                if k < 0:
+                    continue
+
+                version = name[k+5:-8]
+                if version not in CALIBRATION_VERSIONS:
+                    continue
+
+                key = name[:k] + name[-8:]
+                versions.setdefault(key, []).append((version, name))
+
+            files = {}
+            for (key, pairs) in versions.items():
+                pairs.sort(key=lambda p: CALIBRATION_VERSIONS.index(p[0]))
+                files[key] = [name for (version, name) in pairs]
+
+            self.directories[directory] = files
+
+        return self.directories[directory]
+
+    def calibration_files(self, datafile):
+        """Return the names of the calibration files of a data file, in order
+        of increasing version."""
+
+        calpath = datafile.replace('data_raw_','calibration_data_')
+        (directory, basename) = os.path.split(calpath)
+        return list(self.listing(directory).get(basename, []))
+
+    def latest(self, datafile):
+        """Return the path to the highest version of the calibration file of a
+        data file, or None if it has none."""
+
+        names = self.calibration_files(datafile)
+        if not names:
+            return None
+
+        directory = os.path.dirname(datafile.replace('data_raw_',
+                                                     'calibration_data_'))
+        return os.path.join(directory, names[-1])
+
+CALIBRATION_INDEX = CalibrationIndex()
+
+HDAC_TAIL_CHUNK = 4096      # samples read from the end of a file at first
+
+def trailing_zeros(datafile, dtype):
+    """Return (number of samples, number of trailing zero samples) in a binary
+    file. Only the tail of the file is mapped into memory, starting with
+    HDAC_TAIL_CHUNK samples and growing by a factor of four until a nonzero
+    sample is found."""
+
+    dtype = np.dtype(dtype)
+    count = os.path.getsize(datafile) // dtype.itemsize
+
+    (start, stop) = (count, count)
+    chunk = HDAC_TAIL_CHUNK
+    while start > 0:
+        start = max(stop - chunk, 0)
+        tail = np.memmap(datafile, dtype=dtype, mode='r',
+                         offset=start * dtype.itemsize, shape=(stop - start,))
+        nonzero = np.flatnonzero(tail[::-1])
+        del tail
+
+        if len(nonzero):
+            return (count, count - stop + int(nonzero[0]))
+
+        stop = start
+        chunk *= 4
+
+    return (count, count)
+
 def write_uvis_pds4_label(datafile, pds3_label):
 
     # Read the PDS3 label and the VICAR header, fixing known syntax errors
-    with open(pds3_label as f:
+    with open(pds3_label) as f:
         label_text = f.read()
 
     label_text = label_text.replace('\r','') # pyparsing is not set up for <CR>
@@ -520,12 +790,8 @@ def write_uvis_pds4_label(datafile, pds3_label):
         lookup['LINE_BIN'] = [lookup['LINE_BIN']]
 
       # Locate the calibration file(s)
-      lookup['calibration_files'] = []
-      for version in ('3','4','5'):
-        calpath = (datafile.replace('data_raw_','calibration_data_')[:-8] +
-                   '_cal_' + version + datafile[-8:])
-        if os.path.exists(calpath):
-            lookup['calibration_files'].append(os.path.basename(calpath))
+      lookup['calibration_files'] = CALIBRATION_INDEX.calibration_files(
+                                                                    datafile)
 
     # For HDAC, determine mode
     if inst == 'hdac':
@@ -537,12 +803,8 @@ def write_uvis_pds4_label(datafile, pds3_label):
     # For HDAC in modulation mode, count trailing zeros
     if inst == 'hdac':
       if lookup['mode'] == 'modulation':
-        data = np.fromfile(datafile, dtype='uint16')
-        nonzeros = len(data)
-        while data[nonzeros-1] == 0:
-            nonzeros -= 1
-
-        zeros = len(data) - nonzeros
+        (count, zeros) = trailing_zeros(datafile, 'uint16')
+        nonzeros = count - zeros
         if zeros:
             print '%d trailing HDAC zeros found:' % zeros, datafile
 
@@ -615,36 +877,57 @@ def write_uvis_pds4_label(datafile, pds3_label):
 
     # Write the label
     labelfile = datafile[:-4] + '.xml'
-
-    if inst in ('euv', 'fuv'):
-        EUV_FUV_TEMPLATE.write(lookup, labelfile)
-    elif inst == 'hdac':
-        HDAC_TEMPLATE.write(lookup, labelfile)
-    else:
-        HSP_TEMPLATE.write(lookup, labelfile)
+    template_for(inst).write(lookup, labelfile)
 
 ################################################################################
 # Command line interface
 ################################################################################
 
-def label1(pds4_file, replace=False):
+# Files, besides the template, whose contents determine every label
+LOOKUP_TABLES = ['uvis_data_raw_labeler.py', 'SOLAR_SYSTEM_TARGETS.py',
+                 OBSERVATION_IDS.filename, NEW_SCLK_KERNEL[0],
+                 OLD_SCLK_KERNEL[0]] + \
+                [inspect.getsourcefile(obj) for obj in (XmlTemplate,
+                                                        TargetMatcher)]
+
+def product_inputs(pds4_file, pds3_label):
+    """Return the hash of the inputs to the label of one data file. Only the
+    template of the file's own instrument is included, so a change to one
+    template affects only the labels that use it."""
+
+    inst = os.path.basename(pds4_file).split('_')[-1][:-4]
+    files = ([template_for(inst).filename] + LOOKUP_TABLES +
+             [pds3_label, pds4_file])
+    calibration_files = CALIBRATION_INDEX.calibration_files(pds4_file)
+    return label_inputs.inputs_hash(files, [calibration_files])
+
+def label1(pds4_file, replace=False, changed=False):
     """Generate one label file, replacing a pre-existing one only if necessary.
     """
 
     try:
         pds4_file = os.path.abspath(pds4_file)
-        if not replace and os.path.exists(pds4_file[:-4] + '.xml'):
+        labelfile = pds4_file[:-4] + '.xml'
+        if not (replace or changed) and os.path.exists(labelfile):
             return
 
-        parts = pds4_file.split('/data_raw')
-        print('data_raw' + parts[1])
-
         pds3_label = pds4_file.replace( 'cassini_uvis_saturn', 'pds3-labels')
         pds3_label = pds3_label.replace('cassini_uvis_cruise', 'pds3-labels')
         pds3_label = pds3_label[:-4] + '.lbl'
 
+        if changed:
+            inputs = product_inputs(pds4_file, pds3_label)
+            if label_inputs.is_current(labelfile, inputs):
+                return
+
+        parts = pds4_file.split('/data_raw')
+        print('data_raw' + parts[1])
+
         write_uvis_pds4_label(pds4_file, pds3_label)
 
+        if changed:
+            label_inputs.save(labelfile, inputs)
+
     # A KeyboardInterrupt must stop the program
     except KeyboardInterrupt:
         sys.exit(1)
@@ -670,13 +953,20 @@ def main():
     else:
         replace = False
 
+    # Set the changed flag if it's in the argument list
+    if '--changed' in args:
+        changed = True
+        args.remove('--changed')
+    else:
+        changed = False
+
     # Step through the args
     for arg in args:
 
         # Case 1: Label a single image
         if os.path.isfile(arg):
           if arg.endswith('.dat'):
-            label1(arg, replace)
+            label1(arg, replace, changed)
 
         # Case 2: Label all the images in a directory tree, recursively
         elif os.path.isdir(arg):
@@ -685,7 +975,7 @@ def main():
               if name.endswith('.dat'):
 
                 filename = os.path.join(root, name)
-                label1(filename, replace)
+                label1(filename, replace, changed)
 
 if __name__ == '__main__': main()
 
@@ -1,6 +1,21 @@
-import pdsparser
-import numpy as np
+################################################################################
+# survey_vims_calibrated.py
+#
+# Survey the calibrated VIMS cubes to identify the time intervals during which
+# each set of wavelength bins was in use.
+#
+# The tree is walked once. For every cube, only the attached PDS3 label is read
+# and only the handful of keywords needed here are extracted, so a full parse
+# with pdsparser is avoided. The labels are read by a pool of worker processes.
+################################################################################
+
 import os, sys
+import re
+from multiprocessing import Pool
+import pds3_keywords
+
+ROOT = '/Volumes/Untitled/uncompressed/'
+PROCESSES = 8
 
 IR_FLATS = set()
 VIS_FLATS = set()
@@ -11,137 +26,128 @@ MIN_TIMES = {}
 MAX_TIMES = {}
 BINS352 = {}
 
-SKIP = 5
-count = 0
-prev_sclk = ''
-for (root, dirs, files) in os.walk('/Volumes/Untitled/uncompressed/'):
-  if '/geo' in root: continue
-  if '/S' in root: continue
-  for basename in files:
-    if not basename.endswith('.cub'): continue
-
-    sclk = basename[:13]
-    if sclk == prev_sclk: continue
-    prev_sclk = sclk
-
-    count += 1
-    if count % SKIP != 0:
-        continue
-
-    filepath = os.path.join(root, basename)
-    label = pdsparser.PdsLabel.from_file(filepath)
-    bins = tuple(float(x) for x in (label['QUBE']['BAND_BIN']['BAND_BIN_CENTER']))
-    time = str(label['QUBE']['START_TIME'])
-
-    key = bins[-1]
-    if len(bins) > 256:
-        if key in BINS352:
-            if bins != BINS352[key]:
-                raise ValueError('value of last bin is not unique!')
-        else:
-            BINS352[key] = bins
-
-    if key not in MIN_TIMES:
-        MIN_TIMES[key] = (time, filepath)
-        MAX_TIMES[key] = (time, filepath)
-    else:
-        if time < MIN_TIMES[key][0]:
-            MIN_TIMES[key] = (time, filepath)
-        if time > MAX_TIMES[key][0]:
-            MAX_TIMES[key] = (time, filepath)
-
-    print(len(MIN_TIMES), filepath)
-
-    IR_FLATS.add(str(label['QUBE']['CALIBRATION']['IR_FLAT']))
-    VIS_FLATS.add(str(label['QUBE']['CALIBRATION']['VIS_FLAT']))
-    SPECIFIC_ENERGIES.add(str(label['QUBE']['CALIBRATION']['SPECIFIC_ENERGY']))
-    RM_SOLARS.add(str(label['QUBE']['CALIBRATION']['RM_SOLAR']))
-
-min_tuples = list(MIN_TIMES.values())
-max_tuples = list(MAX_TIMES.values())
-min_tuples.sort()
-max_tuples.sort()
-min_tuples = [(x[0],os.path.basename(x[1])) for x in min_tuples]
-max_tuples = [(x[0],os.path.basename(x[1])) for x in max_tuples]
-
-gaps = [(max_tuples[k],min_tuples[k+1]) for k in range(len(min_tuples)-1)]
-
-SKIP = 1
-count = 0
-for (root, dirs, files) in os.walk('/Volumes/Untitled/uncompressed/'):
-  if '/geo' in root: continue
-  if '/S' in root: continue
-  for basename in files:
-    if not basename.endswith('.cub'): continue
-
-    for (below,above) in gaps:
-      if basename <= below[1] or basename >= above[1]: continue
-
-      count += 1
-      if count % SKIP != 0:
-        continue
-
-      filepath = os.path.join(root, basename)
-      label = pdsparser.PdsLabel.from_file(filepath)
-      bins = tuple(float(x) for x in (label['QUBE']['BAND_BIN']['BAND_BIN_CENTER']))
-      time = str(label['QUBE']['START_TIME'])
-      key = bins[-1]
-      print(time, key, filepath)
-
-      if time < MIN_TIMES[key][0]:
-            MIN_TIMES[key] = (time, filepath)
-      if time > MAX_TIMES[key][0]:
-            MAX_TIMES[key] = (time, filepath)
-
-min_tuples = list(MIN_TIMES.values())
-max_tuples = list(MAX_TIMES.values())
-min_tuples.sort()
-max_tuples.sort()
-min_tuples = [(x[0],os.path.basename(x[1])) for x in min_tuples]
-max_tuples = [(x[0],os.path.basename(x[1])) for x in max_tuples]
-
-gaps = [(max_tuples[k],min_tuples[k+1]) for k in range(len(min_tuples)-1)]
-
-SKIP = 1
-count = 0
-for (root, dirs, files) in os.walk('/Volumes/Untitled/uncompressed/'):
-  if '/geo' in root: continue
-  if '/S' in root: continue
-  for basename in files:
-    if not basename.endswith('.cub'): continue
-
-    for (below,above) in gaps:
-      if basename <= below[1] or basename >= above[1]: continue
-
-      count += 1
-      if count % SKIP != 0:
-        continue
-
-      filepath = os.path.join(root, basename)
-      label = pdsparser.PdsLabel.from_file(filepath)
-      bins = tuple(float(x) for x in (label['QUBE']['BAND_BIN']['BAND_BIN_CENTER']))
-      time = str(label['QUBE']['START_TIME'])
-      key = bins[-1]
-      print(time, key, filepath)
-
-      if time < MIN_TIMES[key][0]:
-            MIN_TIMES[key] = (time, filepath)
-      if time > MAX_TIMES[key][0]:
-            MAX_TIMES[key] = (time, filepath)
-
-min_tuples = list(MIN_TIMES.values())
-max_tuples = list(MAX_TIMES.values())
-min_tuples.sort()
-max_tuples.sort()
-min_tuples = [(x[0],os.path.basename(x[1])) for x in min_tuples]
-max_tuples = [(x[0],os.path.basename(x[1])) for x in max_tuples]
-
-gaps = [(max_tuples[k],min_tuples[k+1]) for k in range(len(min_tuples)-1)]
-
-
-
-
-keys = list(MIN_TIMES.keys())
-intervals = [(MIN_TIMES[k][0], MAX_TIMES[k][0], k) for k in keys]                                                     
-intervals.sort()                                                                                             
+################################################################################
+# Targeted label scanner
+################################################################################
+
+UNITS_REGEX = re.compile(r'<[^>]*>')
+QUBE_REGEX = re.compile(r'^\s*OBJECT\s*=\s*QUBE\s*$', re.M)
+
+CALIBRATION_KEYWORDS = ('IR_FLAT', 'VIS_FLAT', 'SPECIFIC_ENERGY', 'RM_SOLAR')
+KEYWORDS = ('BAND_BIN_CENTER', 'START_TIME') + CALIBRATION_KEYWORDS
+
+# Regular expressions to find each keyword, compiled once
+KEYWORD_REGEXES = {}
+for keyword in KEYWORDS:
+    KEYWORD_REGEXES[keyword] = re.compile(r'^\s*' + keyword + r'\s*=\s*',
+                                          re.M)
+
+def keyword_value(label_text, keyword, start=0):
+    """Return the text of the value of a keyword, with quotes and units
+    removed. A parenthesized value is returned as a list of strings. The search
+    for the keyword begins at the given character offset."""
+
+    match = KEYWORD_REGEXES[keyword].search(label_text, start)
+    if match is None:
+        raise KeyError(keyword)
+
+    k = match.end()
+    if label_text[k] == '(':
+        text = label_text[k+1:label_text.index(')', k)]
+        text = UNITS_REGEX.sub('', text)
+        return [v.strip().strip('"').strip() for v in text.split(',')]
+
+    text = label_text[k:label_text.index('\n', k)]
+    text = UNITS_REGEX.sub('', text.split('/*')[0])
+    return text.strip().strip('"').strip()
+
+def survey1(filepath):
+    """Extract the band bin centers, start time, and calibration file names from
+    one cube label."""
+
+    # Reading stops at the "END" statement, so none of the cube data is read
+    label_text = pds3_keywords.read_label_text(filepath).replace('\r', '')
+
+    # Search only within the QUBE object
+    qube = QUBE_REGEX.search(label_text).start()
+
+    bins = tuple(float(x) for x in keyword_value(label_text, 'BAND_BIN_CENTER',
+                                                 qube))
+    time = keyword_value(label_text, 'START_TIME', qube)
+
+    calibration = tuple(keyword_value(label_text, key, qube)
+                        for key in CALIBRATION_KEYWORDS)
+
+    return (filepath, bins, time, calibration)
+
+################################################################################
+# Walk the tree once
+################################################################################
+
+def cube_paths(root_dir):
+    """Return the path to one cube per SCLK value, in directory order."""
+
+    paths = []
+    prev_sclk = ''
+    for (root, dirs, files) in os.walk(root_dir):
+      if '/geo' in root: continue
+      if '/S' in root: continue
+      for basename in files:
+        if not basename.endswith('.cub'): continue
+
+        sclk = basename[:13]
+        if sclk == prev_sclk: continue
+        prev_sclk = sclk
+
+        paths.append(os.path.join(root, basename))
+
+    return paths
+
+################################################################################
+
+def main():
+
+    pool = Pool(PROCESSES)
+    try:
+        results = pool.imap(survey1, cube_paths(ROOT), chunksize=64)
+
+        for (filepath, bins, time, calibration) in results:
+            key = bins[-1]
+            if len(bins) > 256:
+                if key in BINS352:
+                    if bins != BINS352[key]:
+                        raise ValueError('value of last bin is not unique!')
+                else:
+                    BINS352[key] = bins
+
+            if key not in MIN_TIMES:
+                MIN_TIMES[key] = (time, filepath)
+                MAX_TIMES[key] = (time, filepath)
+                print(len(MIN_TIMES), filepath)
+            else:
+                if time < MIN_TIMES[key][0]:
+                    MIN_TIMES[key] = (time, filepath)
+                if time > MAX_TIMES[key][0]:
+                    MAX_TIMES[key] = (time, filepath)
+
+            IR_FLATS.add(calibration[0])
+            VIS_FLATS.add(calibration[1])
+            SPECIFIC_ENERGIES.add(calibration[2])
+            RM_SOLARS.add(calibration[3])
+
+    except BaseException:
+        pool.terminate()
+        pool.join()
+        raise
+
+    pool.close()
+    pool.join()
+
+    keys = list(MIN_TIMES.keys())
+    intervals = [(MIN_TIMES[k][0], MAX_TIMES[k][0], k) for k in keys]
+    intervals.sort()
+
+    return intervals
 
+if __name__ == '__main__':
+    intervals = main()
@@ -63,3 +63,16 @@ def bin_id_from_sclk(sclk):
     diffs = yearfrac - IDS
     return IDS[yearfrac - IDS > 0][-1]
 
+def bin_ids_from_sclks(sclks):
+    """The bin IDs for an array of VIMS SCLK values, as an array of the same
+    shape. Results are identical to calling bin_id_from_sclk() on each value.
+    """
+
+    yearfracs = yearfrac_from_sclk(np.asarray(sclks, dtype='float'))
+
+    # The ID is the last one strictly below the year fraction
+    indices = np.searchsorted(IDS, yearfracs, side='left') - 1
+    if np.any(indices < 0):
+        raise ValueError('SCLK precedes the first bin ID')
+
+    return IDS[indices]
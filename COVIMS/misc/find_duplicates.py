@@ -3,11 +3,17 @@
 import sys, os
 import numpy as np
 import pdsparser
+from vims_inventory import VimsInventory
+
+# The directory trees are listed from the shared inventory
+inventory = VimsInventory()
 
 for arg in sys.argv[1:]:
     basenames = set()
     prev_root = ''
-    for root, dirs, files in os.walk(os.path.join(arg, 'data')):
+    top = os.path.join(arg, 'data')
+    inventory.refresh(top)
+    for root, dirs, files in inventory.walk(top):
       for name in files:
         if name.endswith('.QUB') or name.endswith('.qub'):
 
@@ -24,4 +30,6 @@ for arg in sys.argv[1:]:
 
             basenames.add(rootname)
 
+inventory.close()
+
 
@@ -1,4 +1,6 @@
 import os, sys
+import numpy as np
+from index_table import IndexTable
 
 execfile('VERSIONS.py')
 PDS4_TO_PDS3 = {key:value for (key,value) in VERSIONS_PDS4_VS_PDS3}
@@ -30,28 +32,28 @@ for rec in f:
 
 f.close()
 
-CUMINDEX = {}
-CUMINDEX_BY_BASENAME = {}
-f = open('COVIMS_0999_index.tab')
-for rec in f:
-    filename = rec[1:25].rstrip()
-    directory = rec[29:64]
-    volume = rec[350:361]
-
-    pds3_fullpath = volume + directory + '/' + filename
-    CUMINDEX[pds3_fullpath] = rec
-
-    parts = filename.split('_')
-    if len(parts) == 3:
-        basename = parts[0] + '_' + parts[2]
-    else:
-        basename = parts[0] + '.qub'
-    if basename[0] != 'v':
-        basename = 'v' + basename
-
-    CUMINDEX_BY_BASENAME[basename] = rec
-
-f.close()
+# Read the cumulative index as columns
+INDEX = IndexTable('COVIMS_0999_index.lbl',
+                   columns=['FILE_NAME', 'PATH_NAME', 'VOLUME_ID'])
+RECORDS = np.char.decode(INDEX.records(), 'latin-1')
+FILENAMES = INDEX.strings('FILE_NAME')
+DIRECTORIES = INDEX.strings('PATH_NAME')
+VOLUMES = INDEX.strings('VOLUME_ID')
+
+FULLPATHS = np.char.add(np.char.add(VOLUMES, DIRECTORIES),
+                        np.char.add('/', FILENAMES))
+CUMINDEX = dict(zip(FULLPATHS.tolist(), RECORDS.tolist()))
+
+# Basenames "v<sclk>_<n>_<suffix>" become "v<sclk>_<suffix>"; any other
+# name becomes "v<sclk>.qub", where <sclk> is the part before the first "_"
+PARTS = np.char.partition(FILENAMES, '_')
+TAILS = np.char.partition(PARTS[:,2], '_')
+BASENAMES = np.where(np.char.count(FILENAMES, '_') == 2,
+                     np.char.add(np.char.add(PARTS[:,0], '_'), TAILS[:,2]),
+                     np.char.add(PARTS[:,0], '.qub'))
+BASENAMES = np.where(np.char.startswith(BASENAMES, 'v'), BASENAMES,
+                     np.char.add('v', BASENAMES))
+CUMINDEX_BY_BASENAME = dict(zip(BASENAMES.tolist(), RECORDS.tolist()))
 
 f = open('PDS4_FILES.txt')
 g = open('cum-index.tab', 'w')
@@ -64,6 +64,17 @@ def rc19_id_from_sclk(sclk):
     diffs = yearfrac - IDS
     return IDS[yearfrac - IDS > 0][-1] if diffs[0] > 0 else IDS[0]
 
+def rc19_ids_from_sclks(sclks):
+    """The RC19 IDs for an array of VIMS SCLK values, as an array of the same
+    shape. Results are identical to calling rc19_id_from_sclk() on each value.
+    """
+
+    yearfracs = yearfrac_from_sclk(np.asarray(sclks, dtype='float'))
+
+    # The ID is the last one strictly below the year fraction, or else IDS[0]
+    indices = np.searchsorted(IDS, yearfracs, side='left') - 1
+    return IDS[np.maximum(indices, 0)]
+
 # This pattern matches any filepath in which the basename contains a ten-digit
 # number starting with '12'-'18'.
 REGEX = re.compile(r'(?:|.*[^0-9])(1[2-8][0-9]{8})[^/]*$')
@@ -79,3 +90,16 @@ def rc19_id_from_filename(filename):
     sclk = int(match.group(1))
     return rc19_id_from_sclk(sclk)
 
+def rc19_ids_from_filenames(filenames):
+    """The RC19 IDs for a list of VIMS filepaths, as an array."""
+
+    sclks = []
+    for filename in filenames:
+        match = REGEX.match(filename)
+        if match is None:
+            raise ValueError('not a valid VIMS filename: ' + filename)
+
+        sclks.append(int(match.group(1)))
+
+    return rc19_ids_from_sclks(sclks)
+
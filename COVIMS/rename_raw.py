@@ -1,17 +1,50 @@
 import os, sys
+from vims_inventory import VimsInventory
+from move_journal import MoveJournal
 
 ROOT = '/Volumes/Migration2/pds4/COVIMS_0xxx/'
 DEST = '/Volumes/Migration2/pds4/VIMS/'
+JOURNAL = 'rename_raw.db'
+WORKERS = 16
+
+# Use "--rollback" to move every file in the journal back where it was
+if '--rollback' in sys.argv[1:]:
+    for (path, error) in MoveJournal(JOURNAL).rollback(WORKERS):
+        print '*** rollback failed:', path, error
+    sys.exit(0)
+
+# Plan every move before any file is touched
+moves = []
+sources = set()
+destinations = set()
+
+# Names already in each destination directory, listed once
+dest_listings = {}
+
+def add_move(srcfile, destfile):
+    outdir = os.path.dirname(destfile)
+    if outdir not in dest_listings:
+        if os.path.isdir(outdir):
+            dest_listings[outdir] = set(os.listdir(outdir))
+        else:
+            dest_listings[outdir] = set()
+
+    if destfile in destinations or \
+       os.path.basename(destfile) in dest_listings[outdir]:
+        print 'dest exists:' + srcfile, destfile
+
+    moves.append((srcfile, destfile))
+    sources.add(srcfile)
+    destinations.add(destfile)
 
 execfile('VERSIONS.py')
 for (pds4_basename, pds3_path) in VERSIONS_PDS4_VS_PDS3:
     outdir = pds4_basename[:5] + 'xxxxx'
-    if not os.path.exists(DEST + outdir):
-        os.mkdir(DEST + outdir)
+    add_move(ROOT + pds3_path, DEST + outdir + '/' + pds4_basename)
 
-    os.rename(ROOT + pds3_path, DEST + outdir + '/' + pds4_basename)
-
-for root, dirs, files in os.walk(ROOT):
+inventory = VimsInventory()
+inventory.refresh(ROOT)
+for root, dirs, files in inventory.walk(ROOT):
     print root
     for file in files:
         if not file.endswith('.qub'): continue
@@ -19,9 +52,11 @@ for root, dirs, files in os.walk(ROOT):
             print 'skipped:', os.path.join(root, file)
             continue
 
+        # Files moved by VERSIONS.py are not moved again
+        srcfile = os.path.join(root, file)
+        if srcfile in sources: continue
+
         outdir = file[1:6] + 'xxxxx'
-        if not os.path.exists(DEST + outdir):
-            os.mkdir(DEST + outdir)
 
         parts = file.split('_')
         if len(parts) == 2:
@@ -29,13 +64,12 @@ for root, dirs, files in os.walk(ROOT):
         else:
             outfile = parts[0][1:] + '_' + parts[2]
 
-        srcfile = os.path.join(root, file)
-        destfile = DEST + outdir + '/' + outfile
-        if os.path.exists(destfile):
-            print 'dest exists:' + srcfile, destfile
-
-        os.rename(srcfile, destfile)
-
-
+        add_move(srcfile, DEST + outdir + '/' + outfile)
 
+# Create the directories and move the files. If this run is interrupted,
+# running it again resumes from the journal.
+journal = MoveJournal(JOURNAL)
+journal.plan(moves)
+for (path, error) in journal.run(WORKERS):
+    print '*** move failed:', path, error
 
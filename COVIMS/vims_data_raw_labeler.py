@@ -4,7 +4,7 @@
 # Create XML labels for the PDS4-reformatted Cassini ISS images.
 #
 # Syntax:
-#   python iss_data_raw_labeler.py [--replace] path [path ...]
+#   python iss_data_raw_labeler.py [--replace | --changed] path [path ...]
 #
 # A label will be created for each cube file ("*.qub") found in each given
 # path, recursively. This can be any combination of directories and individual
@@ -12,15 +12,27 @@
 #
 # Use "--replace" to replace pre-existing labels. Otherwise, labels will only be
 # generated for images that currently lack labels.
+#
+# Use "--changed" to replace only the labels whose inputs have changed since
+# they were generated: the template, the lookup tables, the PDS3 label or the
+# cube file. The first run with "--changed" regenerates every label.
 ################################################################################
 
 import os,sys
+import inspect
 import pdsparser
 import traceback
+from functools import partial
+from multiprocessing import Pool, cpu_count
 from xmltemplate import XmlTemplate
 
 from SOLAR_SYSTEM_TARGETS import SOLAR_SYSTEM_TARGETS
 from rc19_id import rc19_id_from_filename
+from vims_inventory import VimsInventory
+from target_matcher import TargetMatcher
+import label_cache
+import pds3_keywords
+import label_inputs
 
 TEMPLATE = XmlTemplate('vims_data_raw_template.xml')
 
@@ -198,6 +210,11 @@ for (name, alts, lid) in STAR_ABBREVS.values():
     TARGET_DICT[name.upper()] = (name, alts, 'Star', 'N/A',
                                  'urn:nasa:pds:context:target:star.%s' % lid)
 
+# Find all the star abbreviations within a string in a single scan
+STAR_MATCHER_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'vims_star_matcher.pickle')
+STAR_MATCHER = TargetMatcher.cached(STAR_ABBREVS.keys(), STAR_MATCHER_CACHE)
+
 def vims_target_info(target_name, target_desc, observation_id,
                      sequence_title, filename):
 
@@ -242,9 +259,8 @@ def vims_target_info(target_name, target_desc, observation_id,
         target_keys.add('Saturn Rings')
 
     # Star IDs are sometimes encoded in the OBSERVATION_ID
-    for (key,value) in STAR_ABBREVS.items():
-        if key in obs_id or key in sequence_title:
-            target_keys.add(value[0])
+    for key in STAR_MATCHER.matches(obs_id, sequence_title):
+        target_keys.add(STAR_ABBREVS[key][0])
 
     # If our set is not empty, we're done:
     if len(target_keys):
@@ -314,19 +330,37 @@ def vims_purpose(image_observation_type):
 
 ################################################################################
 
-def write_pds4_label(datafile, pds3_label):
+RECORD_BYTES = 512
+HEADER_CHUNK = 65536
 
-    def get_naif_id(alts):
-        """Find the NAIF ID among the alt names for a target."""
+def read_isis_header(datafile):
+    """Read the header region of an ISIS2 cube in a single pass.
 
-        naif_id = 'N/A'
-        for alt in alts:
-            if alt.startswith('NAIF ID'):
-                naif_id = int(alt[7:])
+    The attached label and the history section that follows it are read
+    together from the start of the file, stopping where the core begins.
+    Return a tuple (header, history), where header is the dictionary of the
+    ISIS2 label and history is the text of the history section.
+    """
 
-        return naif_id
+    with open(datafile, 'rb') as f:
+        (buffer, end) = pds3_keywords.read_through_end(f, HEADER_CHUNK)
+        if end is None:
+            raise ValueError('ISIS2 label has no END: ' + datafile)
+
+        label_text = buffer[:end].replace('\r','')
+        header = pdsparser.PdsLabel.from_string(label_text).as_dict()
+
+        # Extend the buffer through the end of the history section
+        history_start = (header['^HISTORY'][0] - 1) * RECORD_BYTES
+        history_stop  = (header['^QUBE'][0] - 1) * RECORD_BYTES
+        if len(buffer) < history_stop:
+            buffer += f.read(history_stop - len(buffer))
+
+    return (header, buffer[history_start:history_stop])
+
+def read_pds3_label(pds3_label):
+    """Read and parse a PDS3 label, fixing known syntax errors."""
 
-    # Read the PDS3 label and the ISIS2 header, fixing known syntax errors
     with open(pds3_label) as f:
         label_text = f.read()
 
@@ -352,7 +386,22 @@ def write_pds4_label(datafile, pds3_label):
 
     label_text = label_text.replace('\r','') # pyparsing is not set up for <CR>
 
-    label = pdsparser.PdsLabel.from_string(label_text).as_dict()
+    return pdsparser.PdsLabel.from_string(label_text).as_dict()
+
+def write_pds4_label(datafile, pds3_label):
+
+    def get_naif_id(alts):
+        """Find the NAIF ID among the alt names for a target."""
+
+        naif_id = 'N/A'
+        for alt in alts:
+            if alt.startswith('NAIF ID'):
+                naif_id = int(alt[7:])
+
+        return naif_id
+
+    # Read the PDS3 label
+    label = label_cache.label_dict(pds3_label, read_pds3_label)
 
     # Handle cases where a single string appears in place of a pair
     if isinstance(label['BACKGROUND_SAMPLING_MODE_ID'], str):
@@ -360,9 +409,8 @@ def write_pds4_label(datafile, pds3_label):
         label['BACKGROUND_SAMPLING_MODE_ID'] = (label['BACKGROUND_SAMPLING_MODE_ID'],
                                                 'Information not provided')
 
-    # Read ISIS2 header
-    isis_header = pdsparser.PdsLabel.from_file(datafile)
-    header = isis_header.as_dict()
+    # Read the ISIS2 header and history section together
+    (header, history_buffer) = read_isis_header(datafile)
 
     # Define the lookup dictionary, with the PDS3 label taking precedence
     lookup = header.copy()
@@ -461,12 +509,7 @@ def write_pds4_label(datafile, pds3_label):
     lookup['pre_pds4_version_number'] = pre_pds4_version_number
 
     # Look at the history section of the ISIS2 header for any comments
-    with open(datafile, 'rb') as f:
-        f.seek((history_rec0 - 1) * 512)
-        buffer = f.read(history_recs * 512)
-
-#     buffer = buffer.replace('\r','')
-    recs = buffer.split('\r\n')
+    recs = history_buffer.split('\r\n')
     recs = [r for r in recs if not r.startswith('|')]   # remove comments if any
     buffer = '\n'.join(recs)
 
@@ -488,25 +531,50 @@ def write_pds4_label(datafile, pds3_label):
 # Command line interface
 ################################################################################
 
-def label1(pds4_file, replace=False):
+# Files, besides the template, whose contents determine every label
+LOOKUP_TABLES = ['vims_data_raw_labeler.py', 'SOLAR_SYSTEM_TARGETS.py',
+                 'rc19_id.py', 'PDS3_FILES.txt', 'VERSIONS.py'] + \
+                [inspect.getsourcefile(obj) for obj in (XmlTemplate,
+                                                        TargetMatcher,
+                                                        label_cache,
+                                                        pds3_keywords)]
+
+def product_inputs(pds4_file, pds3_label):
+    """Return the hash of the inputs to the label of one cube."""
+
+    return label_inputs.inputs_hash([TEMPLATE.filename] + LOOKUP_TABLES +
+                                    [pds3_label, pds4_file])
+
+def label1(pds4_file, replace=False, changed=False):
     """Generate one label file, replacing a pre-existing one only if necessary.
     """
 
     try:
         pds4_file = os.path.abspath(pds4_file)
-        if not replace and os.path.exists(pds4_file[:-4] + '.xml'):
+        labelfile = pds4_file[:-4] + '.xml'
+        if not (replace or changed) and os.path.exists(labelfile):
             return
 
         pds3_label = pds4_file[:-3] + 'lbl'
         if os.path.exists(pds3_label):
-            print pds3_label
+            message = pds3_label
         else:
             parts = pds4_file.split('/data_raw/')
             pds3_label = parts[0] + '/pds3-labels/' + parts[1][:-3] + 'lbl'
-            print('data_raw/' + parts[1])
+            message = 'data_raw/' + parts[1]
+
+        if changed:
+            inputs = product_inputs(pds4_file, pds3_label)
+            if label_inputs.is_current(labelfile, inputs):
+                return
+
+        print(message)
 
         write_pds4_label(pds4_file, pds3_label)
 
+        if changed:
+            label_inputs.save(labelfile, inputs)
+
     # A KeyboardInterrupt must stop the program
     except KeyboardInterrupt:
         sys.exit(1)
@@ -520,6 +588,10 @@ def label1(pds4_file, replace=False):
 
 ### MAIN PROGRAM
 
+# Number of worker processes; each worker imports this module and so keeps its
+# own copy of TEMPLATE, already compiled, for the whole run.
+PROCESSES = cpu_count()
+
 def main():
 
     # Get the command line args
@@ -532,22 +604,46 @@ def main():
     else:
         replace = False
 
-    # Step through the args
+    # Set the changed flag if it's in the argument list
+    if '--changed' in args:
+        changed = True
+        args.remove('--changed')
+    else:
+        changed = False
+
+    # The directory trees are listed from the shared inventory
+    inventory = VimsInventory()
+
+    # Gather the cubes to label
+    pds4_files = []
     for arg in args:
 
         # Case 1: Label a single image
         if os.path.isfile(arg):
           if arg.endswith('.qub'):
-            label1(arg, replace)
+            pds4_files.append(arg)
 
         # Case 2: Label all the images in a directory tree, recursively
         elif os.path.isdir(arg):
-          for root, dirs, files in os.walk(os.path.join(arg)):
+          inventory.refresh(arg)
+          for root, dirs, files in inventory.walk(arg):
             for name in files:
               if name.endswith('.qub'):
+                pds4_files.append(os.path.join(root, name))
+
+    inventory.close()
+
+    # Label the cubes in parallel
+    pool = Pool(PROCESSES)
+    try:
+        pool.map(partial(label1, replace=replace, changed=changed),
+                 pds4_files, chunksize=16)
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        sys.exit(1)
 
-                filename = os.path.join(root, name)
-                label1(filename, replace)
+    pool.join()
 
 if __name__ == '__main__': main()
 
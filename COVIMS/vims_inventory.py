@@ -0,0 +1,205 @@
+################################################################################
+# vims_inventory.py
+#
+# A persistent inventory of the files in a VIMS directory tree, stored in a
+# local sqlite file.
+#
+# Usage:
+#   inventory = VimsInventory()
+#   inventory.refresh('/Volumes/Migration2/pds4/COVIMS_0xxx/')
+#   for (root, dirs, files) in inventory.walk('/Volumes/.../COVIMS_0xxx/'):
+#       ...
+#
+# The first refresh of a tree scans every directory. Later refreshes re-list
+# only the directories whose modification time has changed; an unchanged
+# directory costs a single stat call. Note that the modification time of a
+# directory changes when entries are added, removed or renamed, but not when
+# an existing file is rewritten in place; use refresh(root, full=True) after
+# files have been modified in place.
+#
+# File checksums are kept by digest_store, shared with the labelers, so digest()
+# reads a file only if it has changed since its checksum was saved.
+#
+# The default inventory is vims_inventory.db in the directory of this module,
+# so every script shares it wherever it is run from; set the environment
+# variable VIMS_INVENTORY to use a different file.
+################################################################################
+
+import os
+import sqlite3
+import digest_store
+
+try:
+    from os import scandir
+except ImportError:         # Python 2 requires the scandir backport
+    from scandir import scandir
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.environ.get('VIMS_INVENTORY',
+                                 os.path.join(MODULE_DIR, 'vims_inventory.db'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path    TEXT PRIMARY KEY,
+    parent  TEXT,
+    mtime   REAL
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+CREATE TABLE IF NOT EXISTS files (
+    path    TEXT PRIMARY KEY,
+    dir     TEXT,
+    name    TEXT,
+    size    INTEGER,
+    mtime   REAL
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+"""
+
+class VimsInventory(object):
+    """Class to maintain and query a persistent inventory of a directory tree.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        """Open the inventory stored in the given sqlite file, creating it if
+        necessary."""
+
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    ############################################################################
+    # Refresh
+    ############################################################################
+
+    def refresh(self, root, full=False):
+        """Bring the inventory of the tree below the given root up to date.
+
+        Input:
+            root        top directory of the tree.
+            full        True to re-list every directory, regardless of its
+                        modification time.
+        """
+
+        root = os.path.abspath(root)
+        cursor = self.connection.cursor()
+
+        row = cursor.execute('SELECT parent FROM dirs WHERE path=?',
+                             (root,)).fetchone()
+        parent = row[0] if row else None
+        self._refresh_dir(cursor, root, parent, full)
+
+        self.connection.commit()
+
+    def _refresh_dir(self, cursor, path, parent, full):
+        """Refresh one directory, then recurse into its subdirectories."""
+
+        mtime = os.stat(path).st_mtime
+        row = cursor.execute('SELECT mtime FROM dirs WHERE path=?',
+                             (path,)).fetchone()
+
+        # If the directory is unchanged, its list of subdirectories is too
+        if row and row[0] == mtime and not full:
+            subdirs = [r[0] for r in
+                       cursor.execute('SELECT path FROM dirs WHERE parent=?',
+                                      (path,)).fetchall()]
+
+        # Otherwise, list it again
+        else:
+            subdirs = []
+            files = []
+            for entry in scandir(path):
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files.append((entry.path, path, entry.name,
+                                  stat.st_size, stat.st_mtime))
+
+            cursor.execute('DELETE FROM files WHERE dir=?', (path,))
+            cursor.executemany('INSERT INTO files (path, dir, name, size, '
+                               'mtime) VALUES (?,?,?,?,?)', files)
+
+            # Remove subdirectories that no longer exist
+            old_subdirs = [r[0] for r in
+                           cursor.execute('SELECT path FROM dirs WHERE '
+                                          'parent=?', (path,)).fetchall()]
+            for old_subdir in set(old_subdirs) - set(subdirs):
+                self._forget_tree(cursor, old_subdir)
+
+            cursor.execute('INSERT OR REPLACE INTO dirs VALUES (?,?,?)',
+                           (path, parent, mtime))
+
+        for subdir in subdirs:
+            self._refresh_dir(cursor, subdir, path, full)
+
+    def _forget_tree(self, cursor, path):
+        """Remove a directory and everything below it from the inventory."""
+
+        subdirs = [r[0] for r in
+                   cursor.execute('SELECT path FROM dirs WHERE parent=?',
+                                  (path,)).fetchall()]
+        for subdir in subdirs:
+            self._forget_tree(cursor, subdir)
+
+        cursor.execute('DELETE FROM files WHERE dir=?', (path,))
+        cursor.execute('DELETE FROM dirs WHERE path=?', (path,))
+
+    ############################################################################
+    # Queries
+    ############################################################################
+
+    def walk(self, top):
+        """Generate (root, dirs, files) tuples for the tree below top, in the
+        same form as os.walk(). Directory and file names are sorted."""
+
+        top = os.path.abspath(top)
+        cursor = self.connection.cursor()
+
+        stack = [top]
+        while stack:
+            root = stack.pop()
+            subdirs = sorted(r[0] for r in
+                             cursor.execute('SELECT path FROM dirs WHERE '
+                                            'parent=?', (root,)).fetchall())
+            files = sorted(r[0] for r in
+                           cursor.execute('SELECT name FROM files WHERE dir=?',
+                                          (root,)).fetchall())
+
+            yield (root, [os.path.basename(d) for d in subdirs], files)
+            stack += subdirs[::-1]
+
+    def files(self, top, suffix=''):
+        """Return a sorted list of (path, size, mtime) for every file below top
+        whose name ends with the given suffix."""
+
+        top = os.path.abspath(top)
+        cursor = self.connection.cursor()
+        rows = cursor.execute('SELECT path, size, mtime FROM files WHERE '
+                              'dir=? OR substr(dir,1,?)=? ORDER BY path',
+                              (top, len(top) + 1, top + '/')).fetchall()
+
+        return [tuple(r) for r in rows if r[0].endswith(suffix)]
+
+    def info(self, path):
+        """Return (size, mtime) for one file, or None if it is not in the
+        inventory."""
+
+        cursor = self.connection.cursor()
+        row = cursor.execute('SELECT size, mtime FROM files WHERE path=?',
+                             (os.path.abspath(path),)).fetchone()
+        return tuple(row) if row else None
+
+    def digest(self, path, blocksize=1048576):
+        """Return the MD5 checksum of a file in the inventory, from the digest
+        store if the file is unchanged since its checksum was saved."""
+
+        path = os.path.abspath(path)
+        if self.info(path) is None:
+            raise KeyError('not in inventory: ' + path)
+
+        return digest_store.md5(path, blocksize)
+
+################################################################################
@@ -0,0 +1,154 @@
+################################################################################
+# digest_store.py
+#
+# A persistent store of the MD5 checksums of files, kept in a local sqlite
+# file and shared by the labelers.
+#
+# Usage:
+#   import digest_store
+#   checksum = digest_store.md5('/Volumes/.../N1454725799_1.IMG')
+#
+# Each checksum is saved along with the size and modification time of the file
+# at the time it was computed. A checksum is reused only if the file's size and
+# modification time are unchanged; otherwise the file is read again. The
+# default store is ~/.digest_store.db; set the environment variable
+# DIGEST_STORE to use a different file.
+################################################################################
+
+import os
+import sqlite3
+import hashlib
+
+DEFAULT_DB_PATH = os.environ.get('DIGEST_STORE',
+                                 os.path.join(os.path.expanduser('~'),
+                                              '.digest_store.db'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS digests (
+    path        TEXT PRIMARY KEY,
+    size        INTEGER,
+    mtime_ns    INTEGER,
+    md5         TEXT
+);
+"""
+
+def file_md5(path, blocksize=1048576, visit=None):
+    """Return the MD5 checksum of a file, always reading it, in blocks of the
+    given size. If a function visit is given, it is also called with each
+    block, so that other information can be gathered in the same pass."""
+
+    hasher = hashlib.md5()
+    with open(path, 'rb') as f:
+        buf = f.read(blocksize)
+        while len(buf) > 0:
+            hasher.update(buf)
+            if visit:
+                visit(buf)
+            buf = f.read(blocksize)
+
+    return hasher.hexdigest()
+
+def file_key(path):
+    """Return (absolute path, size, mtime in nanoseconds) for a file."""
+
+    stat = os.stat(path)
+    mtime_ns = getattr(stat, 'st_mtime_ns', int(stat.st_mtime * 1.e9))
+    return (os.path.abspath(path), stat.st_size, mtime_ns)
+
+class DigestStore(object):
+    """Class to save and look up file checksums in a sqlite file."""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        """Open the store in the given sqlite file, creating it if necessary.
+        """
+
+        self.db_path = db_path
+
+        # Several labeling processes may share the store; wait for locks
+        self.connection = sqlite3.connect(db_path, timeout=60.)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def lookup(self, path):
+        """Return the saved MD5 checksum of a file, or None if there is none or
+        if the file has changed since it was saved."""
+
+        (abspath, size, mtime_ns) = file_key(path)
+        row = self.connection.execute('SELECT md5 FROM digests WHERE path=? '
+                                      'AND size=? AND mtime_ns=?',
+                                      (abspath, size, mtime_ns)).fetchone()
+        return row[0] if row else None
+
+    def save(self, path, md5):
+        """Save the MD5 checksum of a file, replacing any previous value."""
+
+        (abspath, size, mtime_ns) = file_key(path)
+        self.connection.execute('INSERT OR REPLACE INTO digests '
+                                'VALUES (?,?,?,?)',
+                                (abspath, size, mtime_ns, md5))
+        self.connection.commit()
+
+    def save_many(self, checksums):
+        """Save a list of (path, MD5 checksum) pairs in a single transaction.
+        """
+
+        rows = [file_key(path) + (md5,) for (path, md5) in checksums]
+        self.connection.executemany('INSERT OR REPLACE INTO digests '
+                                    'VALUES (?,?,?,?)', rows)
+        self.connection.commit()
+
+    def md5(self, path, blocksize=1048576):
+        """Return the MD5 checksum of a file, computing and saving it only if
+        necessary."""
+
+        checksum = self.lookup(path)
+        if checksum:
+            return checksum
+
+        checksum = file_md5(path, blocksize)
+        self.save(path, checksum)
+        return checksum
+
+################################################################################
+# Shared store, opened once in each process
+################################################################################
+
+STORE = None
+STORE_PID = None
+
+def store():
+    """Return the shared DigestStore of this process. A sqlite connection cannot
+    be used across a fork, so a child process opens its own."""
+
+    global STORE, STORE_PID
+
+    if STORE is None or STORE_PID != os.getpid():
+        STORE = DigestStore()
+        STORE_PID = os.getpid()
+
+    return STORE
+
+def lookup(path):
+    """Return the saved MD5 checksum of a file if it is still valid; else None.
+    """
+
+    return store().lookup(path)
+
+def save(path, md5):
+    """Save the MD5 checksum of a file in the shared store."""
+
+    store().save(path, md5)
+
+def save_many(checksums):
+    """Save a list of (path, MD5 checksum) pairs in the shared store."""
+
+    store().save_many(checksums)
+
+def md5(path, blocksize=1048576):
+    """Return the MD5 checksum of a file, using the shared store."""
+
+    return store().md5(path, blocksize)
+
+################################################################################
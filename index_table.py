@@ -0,0 +1,254 @@
+################################################################################
+# index_table.py
+#
+# Fast, column-oriented access to a fixed-width ASCII table described by a
+# PDS3 label, typically a cumulative index.
+#
+# Usage:
+#   table = IndexTable('COVIMS_0999_index.lbl', columns=['FILE_NAME',
+#                                                        'VOLUME_ID'])
+#   names = table.strings('FILE_NAME')      # array of str, one per row
+#   rows = table.find('VOLUME_ID', 'COVIMS_0004')
+#   row = table.index_by('FILE_NAME')['v1465673806_2.qub']
+#
+# The table file is memory-mapped as a NumPy structured array with one fixed
+# "S" field per column, so nothing is read until a column is used and every
+# query operates on a whole column at once. Numeric columns are converted on
+# demand and the conversions are cached. Cells that are blank or hold a null
+# value such as "N/A" or "UNK" can be given a fill value in the conversion.
+################################################################################
+
+import os
+import numpy as np
+import pdsparser
+
+INTEGER_TYPES = ('ASCII_INTEGER', 'INTEGER', 'MSB_INTEGER', 'LSB_INTEGER',
+                 'UNSIGNED_INTEGER', 'MSB_UNSIGNED_INTEGER',
+                 'LSB_UNSIGNED_INTEGER')
+REAL_TYPES = ('ASCII_REAL', 'REAL', 'FLOAT', 'DOUBLE')
+
+# Pointers checked first, in order, when the label does not name the table
+TABLE_POINTERS = ('^INDEX_TABLE', '^TABLE')
+
+def table_pointer(label):
+    """Return the name of the pointer to the table in a label dictionary:
+    ^INDEX_TABLE or ^TABLE if present; otherwise the only pointer whose name
+    ends in "TABLE"."""
+
+    for pointer in TABLE_POINTERS:
+        if pointer in label:
+            return pointer
+
+    pointers = [k for k in label if k[0] == '^' and k.endswith('TABLE')]
+    if len(pointers) != 1:
+        raise ValueError('table pointer is missing or ambiguous: ' +
+                         ', '.join(sorted(pointers)))
+
+    return pointers[0]
+
+class IndexTable(object):
+    """Class to access a fixed-width ASCII table as NumPy columns."""
+
+    def __init__(self, label_path, table_path=None, columns=None,
+                       pointer=None):
+        """Construct an IndexTable from a PDS3 label.
+
+        Input:
+            label_path  path to the PDS3 label describing the table.
+            table_path  path to the table file; default is the file named by
+                        the label's pointer, in the label's directory.
+            columns     optional list of the column names to access; default
+                        is all the columns.
+            pointer     optional name of the pointer to the table, e.g.,
+                        "^INDEX_TABLE"; default is found by table_pointer().
+        """
+
+        label = pdsparser.PdsLabel.from_file(label_path).as_dict()
+
+        # Find the table object via its pointer
+        if pointer is None:
+            pointer = table_pointer(label)
+
+        table = label[pointer[1:]]
+        target = label[pointer]
+
+        if isinstance(target, (list, tuple)):
+            (filename, start_record) = (target[0], target[1])
+        else:
+            (filename, start_record) = (target, 1)
+
+        if table_path is None:
+            table_path = os.path.join(os.path.dirname(label_path), filename)
+
+        self.label_path = label_path
+        self.table_path = table_path
+        self.row_bytes = table['ROW_BYTES']
+        self.rows = table['ROWS']
+
+        # Gather the column descriptions, in order of START_BYTE
+        self.column_info = {}
+        for value in table.values():
+            if not isinstance(value, dict): continue
+            if 'START_BYTE' not in value: continue
+
+            name = value['NAME']
+            if columns is not None and name not in columns: continue
+
+            self.column_info[name] = value
+
+        if columns is not None:
+            missing = set(columns) - set(self.column_info.keys())
+            if missing:
+                raise KeyError('columns not found: ' + ', '.join(missing))
+
+        self.column_names = sorted(self.column_info.keys(),
+                                   key=lambda n: self.column_info[n]
+                                                                 ['START_BYTE'])
+
+        # Build the structured dtype; one field per column or column item
+        names = []
+        formats = []
+        offsets = []
+        self.field_names = {}
+        for name in self.column_names:
+            info = self.column_info[name]
+            start = info['START_BYTE'] - 1
+            items = info.get('ITEMS', 1)
+            if items == 1:
+                names.append(name)
+                formats.append('S%d' % info['BYTES'])
+                offsets.append(start)
+                self.field_names[name] = [name]
+            else:
+                item_bytes = info['ITEM_BYTES']
+                item_offset = info.get('ITEM_OFFSET', item_bytes)
+                fields = []
+                for k in range(items):
+                    fields.append('%s_%d' % (name, k))
+                    names.append(fields[-1])
+                    formats.append('S%d' % item_bytes)
+                    offsets.append(start + k * item_offset)
+
+                self.field_names[name] = fields
+
+        self.dtype = np.dtype({'names': names, 'formats': formats,
+                               'offsets': offsets,
+                               'itemsize': self.row_bytes})
+
+        self.array = np.memmap(table_path, dtype=self.dtype, mode='r',
+                               offset=(start_record - 1) * self.row_bytes,
+                               shape=(self.rows,))
+
+        self._strings = {}
+        self._values = {}
+        self._indices = {}
+
+    ############################################################################
+    # Column access
+    ############################################################################
+
+    def column(self, name):
+        """The raw bytes of a column as an "S" array. Shape is (rows,) or, for
+        a column with multiple items, (rows, items)."""
+
+        fields = self.field_names[name]
+        if len(fields) == 1:
+            return self.array[fields[0]]
+
+        return np.stack([self.array[f] for f in fields], axis=-1)
+
+    def strings(self, name):
+        """A column as an array of strings, with enclosing quotes and
+        surrounding blanks removed."""
+
+        if name not in self._strings:
+            column = np.char.strip(self.column(name))
+            column = np.char.strip(column, b'"')
+            column = np.char.strip(column)
+            self._strings[name] = np.char.decode(column, 'latin-1')
+
+        return self._strings[name]
+
+    def values(self, name, fill=None):
+        """A column converted according to its DATA_TYPE: int for integers,
+        float for reals, and str otherwise.
+
+        In a numeric column, a cell that cannot be converted, e.g., because it
+        is blank or holds "N/A", is replaced by the fill value. If fill is
+        None, such a cell raises a ValueError instead.
+        """
+
+        key = (name, fill)
+        if key not in self._values:
+            data_type = self.column_info[name]['DATA_TYPE']
+            if data_type in INTEGER_TYPES:
+                values = self._numbers(name, int, fill)
+            elif data_type in REAL_TYPES:
+                values = self._numbers(name, float, fill)
+            else:
+                values = self.strings(name)
+
+            self._values[key] = values
+
+        return self._values[key]
+
+    def _numbers(self, name, kind, fill):
+        """A numeric column as an array of the given kind, int or float, with
+        the fill value in place of any cell that cannot be converted."""
+
+        try:
+            return self.column(name).astype(kind)
+        except ValueError:
+            if fill is None:
+                raise ValueError('column %s has a value that is not %s; '
+                                 'use a fill value' % (name, kind.__name__))
+
+        # Convert each distinct cell once
+        (texts, rows) = np.unique(self.strings(name), return_inverse=True)
+        numbers = []
+        for text in texts.tolist():
+            try:
+                numbers.append(kind(text))
+            except ValueError:
+                numbers.append(fill)
+
+        return np.array(numbers)[rows]
+
+    ############################################################################
+    # Row access
+    ############################################################################
+
+    def find(self, name, value):
+        """The indices of the rows in which the named column equals the given
+        value."""
+
+        return np.flatnonzero(self.values(name) == value)
+
+    def index_by(self, name):
+        """A dictionary that returns the row index for each value of the named
+        column. If a value appears more than once, the last row is returned."""
+
+        if name not in self._indices:
+            values = self.values(name).tolist()
+            self._indices[name] = {v:k for (k,v) in enumerate(values)}
+
+        return self._indices[name]
+
+    def record(self, row):
+        """The full text of one row, including the record terminator."""
+
+        offset = self.array.offset + row * self.row_bytes
+        with open(self.table_path, 'rb') as f:
+            f.seek(offset)
+            return f.read(self.row_bytes).decode('latin-1')
+
+    def records(self):
+        """The full text of every row as an array of "S" values, each including
+        the record terminator."""
+
+        raw = np.memmap(self.table_path, dtype='S%d' % self.row_bytes,
+                        mode='r', offset=self.array.offset,
+                        shape=(self.rows,))
+        return raw
+
+################################################################################
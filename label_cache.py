@@ -0,0 +1,129 @@
+################################################################################
+# label_cache.py
+#
+# A persistent cache of parsed PDS3 labels, kept in a local sqlite file and
+# shared by the labelers and index scripts.
+#
+# Usage:
+#   import label_cache
+#   label = label_cache.label_dict('/Volumes/.../N1454725799_1.LBL')
+#
+#   # With a custom reader that fixes known errors before parsing
+#   label = label_cache.label_dict(pds3_label, read_pds3_label)
+#
+# Each entry is the pickled dictionary returned by the reader, saved along with
+# the size and modification time of the label file. An entry is reused only if
+# the file's size and modification time are unchanged. Entries are also keyed
+# by the reader function and the file defining it, so labels read in different
+# ways are cached separately; after changing a reader function, call clear() or
+# delete the cache file. The default cache is ~/.label_cache.db; set the environment
+# variable LABEL_CACHE to use a different file.
+################################################################################
+
+import os
+import sqlite3
+import pickle
+import pdsparser
+
+DEFAULT_DB_PATH = os.environ.get('LABEL_CACHE',
+                                 os.path.join(os.path.expanduser('~'),
+                                              '.label_cache.db'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS labels (
+    path        TEXT,
+    reader      TEXT,
+    size        INTEGER,
+    mtime_ns    INTEGER,
+    label       BLOB,
+    PRIMARY KEY (path, reader)
+);
+"""
+
+def read_label(path):
+    """Default reader: parse a PDS3 label file with pdsparser and return it as a
+    dictionary."""
+
+    return pdsparser.PdsLabel.from_file(path).as_dict()
+
+def reader_name(reader):
+    """Return the name under which a reader function's labels are cached."""
+
+    filename = os.path.basename(reader.__code__.co_filename)
+    return filename + ':' + reader.__name__
+
+class LabelCache(object):
+    """Class to save and look up parsed PDS3 labels in a sqlite file."""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        """Open the cache in the given sqlite file, creating it if necessary."""
+
+        self.db_path = db_path
+
+        # Several labeling processes may share the cache; wait for locks
+        self.connection = sqlite3.connect(db_path, timeout=60.)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def clear(self):
+        """Remove every entry from the cache."""
+
+        self.connection.execute('DELETE FROM labels')
+        self.connection.commit()
+
+    def label_dict(self, path, reader=read_label):
+        """Return the dictionary of a PDS3 label, parsing it with the reader
+        function only if the cache does not hold it for the current file."""
+
+        stat = os.stat(path)
+        mtime_ns = getattr(stat, 'st_mtime_ns', int(stat.st_mtime * 1.e9))
+        key = (os.path.abspath(path), reader_name(reader))
+
+        row = self.connection.execute('SELECT label FROM labels WHERE path=? '
+                                      'AND reader=? AND size=? AND '
+                                      'mtime_ns=?',
+                                      key + (stat.st_size,
+                                             mtime_ns)).fetchone()
+        if row:
+            return pickle.loads(bytes(row[0]))
+
+        label = reader(path)
+        blob = sqlite3.Binary(pickle.dumps(label, protocol=2))
+        self.connection.execute('INSERT OR REPLACE INTO labels '
+                                'VALUES (?,?,?,?,?)',
+                                key + (stat.st_size, mtime_ns, blob))
+        self.connection.commit()
+        return label
+
+################################################################################
+# Shared cache, opened once in each process
+################################################################################
+
+CACHE = None
+CACHE_PID = None
+
+def cache():
+    """Return the shared LabelCache of this process. A sqlite connection cannot
+    be used across a fork, so a child process opens its own."""
+
+    global CACHE, CACHE_PID
+
+    if CACHE is None or CACHE_PID != os.getpid():
+        CACHE = LabelCache()
+        CACHE_PID = os.getpid()
+
+    return CACHE
+
+def label_dict(path, reader=read_label):
+    """Return the dictionary of a PDS3 label, using the shared cache."""
+
+    return cache().label_dict(path, reader)
+
+def clear():
+    """Remove every entry from the shared cache."""
+
+    cache().clear()
+
+################################################################################
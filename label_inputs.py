@@ -0,0 +1,123 @@
+################################################################################
+# label_inputs.py
+#
+# A persistent record of the inputs from which each label was generated, kept
+# in a local sqlite file and shared by the labelers.
+#
+# Usage:
+#   import label_inputs
+#   inputs = label_inputs.inputs_hash([template_file, lookup_table, ...,
+#                                      pds3_label, datafile])
+#   if not label_inputs.is_current(labelfile, inputs):
+#       ... write the label ...
+#       label_inputs.save(labelfile, inputs)
+#
+# The hash of a label's inputs combines the MD5 checksums of the input files,
+# in order, and of any additional values on which the label depends. The file
+# checksums come from digest_store, so an unchanged file is not read again. A
+# label is current if it exists and the hash of its inputs matches the one
+# saved when it was written. The default store is ~/.label_inputs.db; set the
+# environment variable LABEL_INPUTS to use a different file.
+################################################################################
+
+import os
+import sqlite3
+import hashlib
+import digest_store
+
+DEFAULT_DB_PATH = os.environ.get('LABEL_INPUTS',
+                                 os.path.join(os.path.expanduser('~'),
+                                              '.label_inputs.db'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS labels (
+    path        TEXT PRIMARY KEY,
+    inputs      TEXT
+);
+"""
+
+def inputs_hash(paths, values=()):
+    """Return the MD5 hash of a label's inputs, given the paths to its input
+    files and a list of any other values on which it depends."""
+
+    hasher = hashlib.md5()
+    for path in paths:
+        hasher.update(digest_store.md5(path).encode('ascii'))
+        hasher.update(b'\n')
+
+    for value in values:
+        hasher.update(repr(value).encode('ascii', 'backslashreplace'))
+        hasher.update(b'\n')
+
+    return hasher.hexdigest()
+
+class LabelInputs(object):
+    """Class to save and look up the input hashes of labels in a sqlite file."""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        """Open the store in the given sqlite file, creating it if necessary.
+        """
+
+        self.db_path = db_path
+
+        # Several labeling processes may share the store; wait for locks
+        self.connection = sqlite3.connect(db_path, timeout=60.)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def lookup(self, labelfile):
+        """Return the saved input hash of a label, or None if there is none."""
+
+        row = self.connection.execute('SELECT inputs FROM labels WHERE path=?',
+                                      (os.path.abspath(labelfile),)).fetchone()
+        return row[0] if row else None
+
+    def save(self, labelfile, inputs):
+        """Save the input hash of a label, replacing any previous value."""
+
+        self.connection.execute('INSERT OR REPLACE INTO labels VALUES (?,?)',
+                                (os.path.abspath(labelfile), inputs))
+        self.connection.commit()
+
+    def is_current(self, labelfile, inputs):
+        """True if the label exists and was generated from the given inputs."""
+
+        return os.path.exists(labelfile) and self.lookup(labelfile) == inputs
+
+################################################################################
+# Shared store, opened once in each process
+################################################################################
+
+STORE = None
+STORE_PID = None
+
+def store():
+    """Return the shared LabelInputs of this process. A sqlite connection cannot
+    be used across a fork, so a child process opens its own."""
+
+    global STORE, STORE_PID
+
+    if STORE is None or STORE_PID != os.getpid():
+        STORE = LabelInputs()
+        STORE_PID = os.getpid()
+
+    return STORE
+
+def lookup(labelfile):
+    """Return the saved input hash of a label, or None if there is none."""
+
+    return store().lookup(labelfile)
+
+def save(labelfile, inputs):
+    """Save the input hash of a label in the shared store."""
+
+    store().save(labelfile, inputs)
+
+def is_current(labelfile, inputs):
+    """True if the label exists and was generated from the given inputs."""
+
+    return store().is_current(labelfile, inputs)
+
+################################################################################
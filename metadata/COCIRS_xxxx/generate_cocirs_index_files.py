@@ -14,6 +14,7 @@ import julian
 import numpy as np
 import pdstable
 import pdsparser
+import label_cache
 import re
 
 # The list of COLUMN_NUMBER that has the data being modified by replacing " with
@@ -300,6 +301,33 @@ def get_cirs_obs_id(filespec, start_time, stop_time, tol_list):
           obs_by_name)
     return obs_by_time[0]
 
+def read_data_label(data_label_filename):
+    """Read and parse a data label under DATA/CUBE, fixing labels that pdsparser
+    cannot read.
+    """
+    lines = pdsparser.PdsLabel.load_file(data_label_filename)
+    obj_li = []
+    obj_pattern = r'\s*OBJECT\s+=\s+(\w*)'
+    unterminated_end_obj = r'\s*END_OBJECT\s*(^\=)'
+    for i in range(len(lines)):
+        if 'CSS:' in lines[i]:
+            lines[i] = lines[i].replace('CSS:', '')
+
+        # Fix the issue that END_OBJECT is not properly terminated
+        if 'END_OBJECT' in lines[i]:
+            try:
+                current_obj = obj_li.pop()
+            except IndexError:
+                raise 'Unmatch OBJECT in ' + data_label_filename
+            if lines[i].strip() == 'END_OBJECT':
+                lines[i] = lines[i] + ' =' + current_obj
+        elif 'OBJECT' in lines[i]:
+            match = re.match(obj_pattern, lines[i])
+            if match is not None:
+                    obj_li.append(match[1])
+
+    return pdsparser.PdsLabel.from_string(lines).as_dict()
+
 def create_supplemental_index_tab(orig_rows, vol_root, supp_index_tab_path):
     """Create supplemental index tab
     """
@@ -312,34 +340,14 @@ def create_supplemental_index_tab(orig_rows, vol_root, supp_index_tab_path):
         filespec = row['FILE_SPECIFICATION_NAME']
         data_label_filename = vol_root + '/' + filespec
 
-        # Modify labels under DATA/CUBE before passing into PdsTable
         try:
-            lines = pdsparser.PdsLabel.load_file(data_label_filename)
+            data_label = label_cache.label_dict(data_label_filename,
+                                                read_data_label)
         except FileNotFoundError:
             # Print a warning is data label is missing under DATA/
             print(f'****** Warning: missing data label {data_label_filename} ******')
             continue
-        obj_li = []
-        obj_pattern = r'\s*OBJECT\s+=\s+(\w*)'
-        unterminated_end_obj = r'\s*END_OBJECT\s*(^\=)'
-        for i in range(len(lines)):
-            if 'CSS:' in lines[i]:
-                lines[i] = lines[i].replace('CSS:', '')
-
-            # Fix the issue that END_OBJECT is not properly terminated
-            if 'END_OBJECT' in lines[i]:
-                try:
-                    current_obj = obj_li.pop()
-                except IndexError:
-                    raise 'Unmatch OBJECT in ' + data_label_filename
-                if lines[i].strip() == 'END_OBJECT':
-                    lines[i] = lines[i] + ' =' + current_obj
-            elif 'OBJECT' in lines[i]:
-                match = re.match(obj_pattern, lines[i])
-                if match is not None:
-                        obj_li.append(match[1])
-
-        data_label = pdsparser.PdsLabel.from_string(lines).as_dict()
+
         # Get the data in supplemental index files
         mission_phase = data_label['MISSION_PHASE_NAME'].strip()
         focal_plane = data_label['FOCAL_PLANE']
@@ -1,30 +1,38 @@
 import os,sys
+import numpy as np
 import pdsparser
-import pdstable
+from index_table import IndexTable
 
 HOLDINGS = '/Volumes/pdsdata-offsite/holdings/'
 
 ROOT = HOLDINGS + 'volumes/COUVIS_8xxx/COUVIS_8001/data/'
 INDEX = HOLDINGS + 'metadata/COUVIS_8xxx/COUVIS_8001/COUVIS_8001_supplemental_index.tab'
 
-RAW_DICTS = pdstable.PdsTable(
+RAW_INDEX = IndexTable(
     HOLDINGS + 'metadata/COUVIS_0xxx/COUVIS_0999/COUVIS_0999_index.lbl',
-    columns = ['FILE_NAME', 'INTEGRATION_DURATION']).dicts_by_row()
+    columns = ['FILE_NAME', 'INTEGRATION_DURATION'])
 
-DURATIONS_VS_LBL = {os.path.basename(d['FILE_NAME']):d['INTEGRATION_DURATION']
-                    for d in RAW_DICTS if 'HSP' in d['FILE_NAME']}
+RAW_NAMES = RAW_INDEX.strings('FILE_NAME')
+HSP_ROWS = np.flatnonzero(np.char.find(RAW_NAMES, 'HSP') >= 0)
+DURATIONS_VS_LBL = dict(zip(
+    [os.path.basename(n) for n in RAW_NAMES[HSP_ROWS]],
+    RAW_INDEX.values('INTEGRATION_DURATION')[HSP_ROWS].tolist()))
 
-SUPP_DICTS = pdstable.PdsTable(
+SUPP_INDEX = IndexTable(
     HOLDINGS + 'metadata/COUVIS_0xxx/COUVIS_0999/COUVIS_0999_supplemental_index.lbl',
-    columns = ['FILE_SPECIFICATION_NAME', 'OBSERVATION_ID']).dicts_by_row()
+    columns = ['FILE_SPECIFICATION_NAME', 'OBSERVATION_ID'])
+
+SUPP_NAMES = SUPP_INDEX.strings('FILE_SPECIFICATION_NAME')
+SUPP_OBSIDS = SUPP_INDEX.strings('OBSERVATION_ID')
+SUPP_HSP_ROWS = np.flatnonzero(np.char.find(SUPP_NAMES, 'HSP') >= 0)
 
 DURATIONS_VS_OBSID = {}
-for d in SUPP_DICTS:
-    lbl = os.path.basename(d['FILE_SPECIFICATION_NAME'])
+for k in SUPP_HSP_ROWS:
+    (filespec, obsid) = (SUPP_NAMES[k], SUPP_OBSIDS[k])
+    lbl = os.path.basename(filespec)
     if 'HSP' not in lbl:
         continue
 
-    obsid = d['OBSERVATION_ID']
     duration = DURATIONS_VS_LBL[lbl]
 
     if obsid in DURATIONS_VS_OBSID:
@@ -8,7 +8,7 @@
 ################################################################################
 
 import os, sys
-import pdsparser
+import label_cache
 
 def write_rec(f, label_filename, volume_id):
 
@@ -33,7 +33,7 @@ def write_rec(f, label_filename, volume_id):
 
         return
 
-    label = pdsparser.PdsLabel.from_file(label_filename).as_dict()
+    label = label_cache.label_dict(label_filename)
 
     cap_filename = label_filename.upper()
     idata = cap_filename.rindex('DATA')
@@ -0,0 +1,172 @@
+################################################################################
+# move_journal.py
+#
+# Move many files to new locations in two phases, recording every move in a
+# journal kept in a local sqlite file, so that an interrupted run can be
+# resumed and a completed run can be rolled back.
+#
+# Usage:
+#   journal = MoveJournal('reorganize.db')
+#   journal.plan(moves)             # list of (oldpath, newpath) tuples
+#   journal.run(workers=16)
+#   ...
+#   journal.rollback()              # put everything back
+#
+# In the first phase, plan() records every move before any file is touched.
+# In the second, run() creates all the destination directories, and then
+# renames the files in parallel threads, one source directory per task. Each
+# completed move is marked in the journal. Running the same plan again resumes
+# where it stopped; a move whose file is already at its destination is just
+# marked as done. Use a new journal file for each reorganization.
+################################################################################
+
+import os
+import sqlite3
+from multiprocessing.pool import ThreadPool
+
+try:
+    from os import scandir
+except ImportError:         # Python 2 requires the scandir backport
+    from scandir import scandir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS moves (
+    oldpath TEXT PRIMARY KEY,
+    newpath TEXT,
+    moved   INTEGER
+);
+"""
+
+def scan_files(top):
+    """Generate (dirpath, filename) for every file below top, listing each
+    directory once. Like os.walk(), it generates nothing if top does not
+    exist."""
+
+    if not os.path.isdir(top):
+        return
+
+    stack = [top.rstrip('/')]
+    while stack:
+        dirpath = stack.pop()
+        subdirs = []
+        for entry in scandir(dirpath):
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            else:
+                yield (dirpath, entry.name)
+
+        stack += sorted(subdirs, reverse=True)
+
+def make_dirs(dirpaths):
+    """Create every directory in the list that does not already exist,
+    parents first."""
+
+    for dirpath in sorted(set(dirpaths)):
+        if not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+
+def _rename_group(group):
+    """Rename a list of (source, destination) pairs; return a list of
+    (source, None or error message). A file already at its destination
+    counts as renamed."""
+
+    results = []
+    for (src, dst) in group:
+        try:
+            os.rename(src, dst)
+            results.append((src, None))
+
+        # Only if the rename fails, check whether it was already done
+        except OSError as e:
+            if not os.path.exists(src) and os.path.exists(dst):
+                results.append((src, None))
+            else:
+                results.append((src, str(e)))
+
+    return results
+
+class MoveJournal(object):
+    """Class to plan, execute, resume and roll back a set of file moves."""
+
+    def __init__(self, db_path):
+        """Open the journal in the given sqlite file, creating it if necessary.
+        """
+
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def plan(self, moves):
+        """Record a list of (oldpath, newpath) moves. A move already in the
+        journal is left as it is."""
+
+        self.connection.executemany('INSERT OR IGNORE INTO moves '
+                                    'VALUES (?,?,0)', moves)
+        self.connection.commit()
+
+    def pending(self):
+        """Return the list of (oldpath, newpath) moves not yet done."""
+
+        return self.connection.execute('SELECT oldpath, newpath FROM moves '
+                                       'WHERE moved=0').fetchall()
+
+    def done(self):
+        """Return the list of (oldpath, newpath) moves already done."""
+
+        return self.connection.execute('SELECT oldpath, newpath FROM moves '
+                                       'WHERE moved=1').fetchall()
+
+    def _execute(self, pairs, moved, workers):
+        """Rename (source, destination) pairs in parallel, grouped by source
+        directory, marking each completed move in the journal. Return the list
+        of (source, error message) for the renames that failed."""
+
+        make_dirs([os.path.dirname(dst) for (src, dst) in pairs])
+
+        groups = {}
+        for pair in pairs:
+            groups.setdefault(os.path.dirname(pair[0]), []).append(pair)
+
+        column = 'oldpath' if moved else 'newpath'
+        query = 'UPDATE moves SET moved=? WHERE %s=?' % column
+
+        failures = []
+        pool = ThreadPool(workers)
+        try:
+            for results in pool.imap_unordered(_rename_group, groups.values()):
+                self.connection.executemany(query,
+                                            [(moved, src) for (src, error)
+                                             in results if error is None])
+                self.connection.commit()
+                failures += [(src, error) for (src, error) in results
+                             if error is not None]
+        except BaseException:
+            pool.terminate()
+            pool.join()
+            raise
+
+        pool.close()
+        pool.join()
+        return failures
+
+    def run(self, workers=16):
+        """Do every planned move not yet done. Return the list of
+        (oldpath, error message) for the moves that failed."""
+
+        return self._execute(self.pending(), 1, workers)
+
+    def rollback(self, workers=16):
+        """Undo every move, recreating any source directories that have since
+        been removed. Moves not marked as done are included, in case a run
+        stopped between a rename and its journal entry. Return the list of
+        (newpath, error message) for the moves that could not be undone."""
+
+        pairs = [(newpath, oldpath) for (oldpath, newpath)
+                 in self.connection.execute('SELECT oldpath, newpath '
+                                            'FROM moves').fetchall()]
+        return self._execute(pairs, 0, workers)
+
+################################################################################
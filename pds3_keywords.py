@@ -0,0 +1,407 @@
+################################################################################
+# pds3_keywords.py
+#
+# Read a few keyword values from a PDS3 label without a full parse.
+#
+# Usage:
+#   import pds3_keywords
+#   values = pds3_keywords.label_values('N1454725799_1.LBL',
+#                                       ['START_TIME', 'IMAGE.LINES'])
+#   values['IMAGE.LINES']       # -> 1024
+#
+# A keyword inside an OBJECT or GROUP is named by its path, with the object
+# names and the keyword separated by dots, e.g., "SPECTRAL_QUBE.BAND_BIN.BANDS".
+# A keyword that is not in the label is absent from the returned dictionary.
+#
+# The label text is scanned once. Simple values are converted directly:
+# integers, reals (with any units removed), symbols, quoted strings on a single
+# line, dates and times, and sequences of these in parentheses. Anything else,
+# such as sets, pointers, based integers, multi-line strings, or a label with
+# repeated keywords or objects, is obtained instead from a full parse of the
+# label by pdsparser. Either way, each value returned is the same as the one in
+# pdsparser.PdsLabel.as_dict().
+#
+# label_texts() returns instead the text of each value as written in the label,
+# without conversion; it never needs pdsparser.
+################################################################################
+
+import re
+import datetime
+import pdsparser
+
+LABEL_CHUNK = 65536
+END_LINE_REGEX = re.compile(br'^END[ \t\r]*\n', re.M)   # complete END line
+END_AT_EOF_REGEX = re.compile(br'^END\s*\Z', re.M)      # END as the last line
+
+STATEMENT_REGEX = re.compile(r'^\s*([A-Za-z^][A-Za-z0-9_:]*)\s*=\s*(.*)$')
+END_OBJECT_REGEX = re.compile(r'^\s*(END_OBJECT|END_GROUP)\s*(?:=.*)?$')
+END_STATEMENT_REGEX = re.compile(r'^\s*END\s*$')
+COMMENT_REGEX = re.compile(r'/\*.*?\*/')
+QUOTED_REGEX = re.compile(r'"[^"]*"|\'[^\']*\'')
+UNITS_REGEX = re.compile(r'^(.*?)\s*<[^<>]*>$')
+
+INTEGER_REGEX = re.compile(r'^[+-]?\d+$')
+REAL_REGEX = re.compile(r'^[+-]?(\d+\.\d*|\.\d+|\d+(?=[eE]))([eE][+-]?\d+)?$')
+SYMBOL_REGEX = re.compile(r'^[A-Z][A-Z0-9_]*$')
+
+# Quoted text that pdsparser might read as a date or time
+DATE_LIKE_REGEX = re.compile(r'^\s*[+-]?\d.*[-:]')
+
+DATE_REGEX = re.compile(r'^(\d{4})-(?:(\d{3})|(\d\d)-(\d\d))'
+                        r'(?:T(\d\d):(\d\d):(\d\d)(?:\.(\d*))?Z?)?$')
+
+# pdsparser names these objects by the value of their NAME keyword
+NAMED_OBJECTS = set(['COLUMN', 'FIELD', 'BIT_COLUMN', 'ELEMENT_DEFINITION',
+                     'GENERIC_OBJECT_DEFINITION', 'SPECIFIC_OBJECT_DEFINITION'])
+
+class FallBack(Exception):
+    """Raised when a value must be obtained from pdsparser."""
+    pass
+
+################################################################################
+# Value conversion
+################################################################################
+
+def convert_date(text):
+    """Convert a date or date-time the way pdsparser does: the trailing "Z" is
+    removed and any fractional seconds are padded to 3 or 6 digits. Raise
+    FallBack for anything unusual."""
+
+    match = DATE_REGEX.match(text)
+    if match is None:
+        raise FallBack(text)
+
+    (year, doy, month, day, hour, minute, second, fraction) = match.groups()
+
+    try:
+        if doy:
+            date = datetime.date(int(year), 1, 1)
+            date += datetime.timedelta(int(doy) - 1)
+            if doy == '000' or date.year != int(year):
+                raise ValueError(doy)
+        else:
+            datetime.date(int(year), int(month), int(day))
+    except ValueError:
+        raise FallBack(text)
+
+    if hour is None:
+        return text
+
+    if int(hour) > 23 or int(minute) > 59 or int(second) > 59:
+        raise FallBack(text)
+
+    text = text.rstrip('Z')
+    if fraction is None:
+        return text
+
+    if len(fraction) <= 3:
+        return text[:-len(fraction) or None] + fraction.ljust(3, '0')
+
+    if len(fraction) <= 6:
+        return text[:-len(fraction)] + fraction.ljust(6, '0')
+
+    raise FallBack(text)
+
+def convert_scalar(text, in_sequence=False):
+    """Convert the text of a single value; raise FallBack if it is not one of
+    the simple types handled here."""
+
+    text = text.strip()
+
+    if text[:1] in ('"', "'"):
+        quote = text[0]
+        if len(text) < 2 or not text.endswith(quote):
+            raise FallBack(text)
+
+        value = text[1:-1]
+        if '"' in value or "'" in value or '\\' in value or '\t' in value:
+            raise FallBack(text)
+
+        # Within a sequence, a date becomes a datetime object
+        if DATE_LIKE_REGEX.match(value):
+            if in_sequence or quote != '"' or value != value.strip():
+                raise FallBack(text)
+            return convert_date(value)
+
+        return value.strip()
+
+    # Units are allowed only after a number
+    match = UNITS_REGEX.match(text)
+    if match:
+        text = match.group(1)
+        if not (INTEGER_REGEX.match(text) or REAL_REGEX.match(text)):
+            raise FallBack(text)
+
+    if INTEGER_REGEX.match(text):
+        return int(text)
+
+    if REAL_REGEX.match(text):
+        return float(text)
+
+    if SYMBOL_REGEX.match(text):
+        return text
+
+    if in_sequence:
+        raise FallBack(text)
+
+    return convert_date(text)
+
+def split_items(text):
+    """Split the inside of a sequence at the commas that are not quoted."""
+
+    items = []
+    item = ''
+    quote = None
+    for c in text:
+        if c in ('"', "'"):
+            if quote is None:
+                quote = c
+            elif quote == c:
+                quote = None
+        elif c == ',' and quote is None:
+            items.append(item)
+            item = ''
+            continue
+
+        item += c
+
+    items.append(item)
+    return items
+
+def convert_value(text):
+    """Convert the text of a value, which may be a sequence of simple values;
+    raise FallBack for anything else."""
+
+    text = text.strip()
+
+    if text.startswith('('):
+        if not text.endswith(')'):
+            raise FallBack(text)
+
+        inside = text[1:-1]
+        if '(' in inside or ')' in inside or not inside.strip():
+            raise FallBack(text)
+
+        return [convert_scalar(item, True) for item in split_items(inside)]
+
+    return convert_scalar(text)
+
+################################################################################
+# Label scanner
+################################################################################
+
+def remove_comments(value):
+    """Remove comments from the text of a value. Return None if a comment might
+    be inside a quoted string or might continue onto the next line."""
+
+    quoted = max(value.rfind('"'), value.rfind("'"))
+    (head, tail) = (value[:quoted+1], value[quoted+1:])
+    if '/*' in head:
+        return None
+
+    tail = COMMENT_REGEX.sub('', tail)
+    if '/*' in tail:
+        return None
+
+    return head + tail
+
+def is_open(value):
+    """True if a value contains an unclosed sequence or set."""
+
+    value = QUOTED_REGEX.sub('', value)
+    return (value.count('(') > value.count(')') or
+            value.count('{') > value.count('}'))
+
+def statements(label_text):
+    """Generate (path, value_text) for every statement in the label, where the
+    path includes the names of the enclosing OBJECTs and GROUPs. For an OBJECT
+    or GROUP statement, the path ends with the object's name. A value that
+    cannot be read reliably here is returned as None. The path is None if
+    pdsparser would not name the statement by this path."""
+
+    stack = []
+    named = 0           # number of enclosing objects named by NAME
+    lines = label_text.split('\n')
+    k = 0
+    while k < len(lines):
+        line = lines[k]
+        k += 1
+
+        if END_STATEMENT_REGEX.match(line):
+            return
+
+        # Skip over a comment that spans lines
+        if line.lstrip().startswith('/*') and '*/' not in line:
+            while k < len(lines) and '*/' not in lines[k]:
+                k += 1
+            k += 1
+            continue
+
+        if END_OBJECT_REGEX.match(line):
+            if stack and stack.pop() in NAMED_OBJECTS:
+                named -= 1
+            continue
+
+        match = STATEMENT_REGEX.match(line)
+        if match is None:
+            continue
+
+        (name, value) = match.groups()
+
+        # A quoted string may continue onto later lines
+        if value.count('"') % 2 == 1:
+            while k < len(lines) and value.count('"') % 2 == 1:
+                value += '\n' + lines[k]
+                k += 1
+            value = None
+
+        elif '/*' in value:
+            value = remove_comments(value)
+
+        # A sequence or set may continue onto later lines
+        while value is not None and k < len(lines) and is_open(value):
+            if lines[k].count('"') % 2 == 1:
+                value = None
+            else:
+                value += ' ' + (remove_comments(lines[k]) or '')
+                k += 1
+
+        if value is not None:
+            value = value.strip()
+
+        if named:
+            path = None
+        elif name in ('OBJECT', 'GROUP'):
+            path = None if value is None else '.'.join(stack + [value])
+        else:
+            path = '.'.join(stack + [name])
+
+        yield (path, value)
+
+        if name in ('OBJECT', 'GROUP'):
+            stack.append(value)
+            if value in NAMED_OBJECTS:
+                named += 1
+
+def text_values(label_text, keywords):
+    """Return a dictionary of the values of the given keywords within the text
+    of a PDS3 label."""
+
+    label_text = label_text.replace('\r', '')
+
+    # pdsparser renames repeated keywords and objects, and names some objects
+    # by the value of their NAME keyword. In a label containing any of these,
+    # every value is obtained from pdsparser.
+    wanted = set(keywords)
+    found = {}
+    paths = set()
+    regular = True
+    for (path, value) in statements(label_text):
+        if path is None or path in paths:
+            regular = False
+            break
+
+        paths.add(path)
+        if path in wanted:
+            found[path] = value
+
+    values = {}
+    fallbacks = []
+    for keyword in keywords:
+        name = keyword.split('.')[-1]
+        if (not regular or keyword != keyword.upper() or '^' in keyword or
+            name in ('OBJECT', 'GROUP', 'END_OBJECT', 'END_GROUP', 'END')):
+            fallbacks.append(keyword)
+            continue
+
+        if keyword not in found:
+            continue
+
+        try:
+            if found[keyword] is None:
+                raise FallBack(keyword)
+            values[keyword] = convert_value(found[keyword])
+        except FallBack:
+            fallbacks.append(keyword)
+
+    if fallbacks:
+        label = pdsparser.PdsLabel.from_string(label_text).as_dict()
+        for keyword in fallbacks:
+            value = label
+            try:
+                for name in keyword.split('.'):
+                    value = value[name]
+            except (KeyError, TypeError):
+                continue
+
+            values[keyword] = value
+
+    return values
+
+def read_through_end(f, chunksize=None):
+    """Read an open binary file from its current position through the "END"
+    line of its PDS3 label, in chunks of the given size; default LABEL_CHUNK.
+
+    Return a tuple (buffer, end), where buffer holds every byte read and end is
+    the offset in buffer just past the END line, or None if there is none. The
+    line "END" might be only the start of "END_OBJECT" until the rest of the
+    line is read, so it must end with a newline unless it is the last line of
+    the file.
+    """
+
+    chunksize = chunksize or LABEL_CHUNK
+
+    buffer = b''
+    while True:
+
+        # Lines before the last, incomplete one have already been searched
+        start = buffer.rfind(b'\n') + 1
+        chunk = f.read(chunksize)
+        if not chunk:
+            match = END_AT_EOF_REGEX.search(buffer, start)
+            return (buffer, match.end() if match else None)
+
+        buffer += chunk
+        match = END_LINE_REGEX.search(buffer, start)
+        if match:
+            return (buffer, match.end())
+
+def read_label_text(filepath):
+    """Return the text of a PDS3 label file, or of the label attached to a data
+    file. Reading stops at the "END" statement."""
+
+    with open(filepath, 'rb') as f:
+        (text, end) = read_through_end(f)
+
+    if end is not None:
+        text = text[:end]
+
+    # Under Python 2, the label text is already a str
+    if not isinstance(text, str):
+        text = text.decode('latin-1')
+
+    return text
+
+def label_values(filepath, keywords):
+    """Return a dictionary of the values of the given keywords within a PDS3
+    label file, or the label attached to a data file."""
+
+    return text_values(read_label_text(filepath), keywords)
+
+def label_texts(filepath, keywords):
+    """Return a dictionary of the text of the values of the given keywords
+    within a PDS3 label file, as written but with comments removed. If a
+    keyword is repeated, its first value is returned; a value that cannot be
+    read reliably without a full parse is absent."""
+
+    label_text = read_label_text(filepath).replace('\r', '')
+
+    wanted = set(keywords)
+    texts = {}
+    for (path, value) in statements(label_text):
+        if path in wanted and value is not None and path not in texts:
+            texts[path] = value
+
+    return texts
+
+################################################################################
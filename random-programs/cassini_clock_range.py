@@ -9,24 +9,20 @@ import sys
 import os
 import re
 import datetime
+import pds3_keywords
 
 VOLUME_ID_REGEX  = re.compile(r'(?:|.*/)([A-Z]{2}[A-Z0-9]{0,4}_[0-9]{4})(?:|_.*|/.*)\Z')
-START_TIME_REGEX = re.compile(r'^START_TIME *= *(?:|")(....-.*T..:..:..[\.0-9]*)(|Z)(|")\s*\Z')
-STOP_TIME_REGEX  = re.compile(r'^STOP_TIME *= *(?:|")(....-.*T..:..:..[\.0-9]*)(|Z)(|")\s*\Z')
-ALT_TIME_REGEX   = re.compile(r'^IMAGE_TIME *= *(?:|")(....-.*T..:..:..[\.0-9]*)(|Z)(|")\s*\Z')
+TIME_REGEX       = re.compile(r'^(?:|")(....-.*T..:..:..[\.0-9]*)(|Z)(|")\Z')
+SCLK_REGEX       = re.compile(r'^"(?:|[1-9]/)(.*)"\Z')
 
-START_SCLK_REGEX = re.compile(r'^SPACECRAFT_CLOCK_START_COUNT *= *"(?:|[1-9]/)(.*)"\s*\Z')
-STOP_SCLK_REGEX  = re.compile(r'^SPACECRAFT_CLOCK_STOP_COUNT *= *"(?:|[1-9]/)(.*)"\s*\Z')
-ALT_SCLK_REGEX   = re.compile(r'^SPACECRAFT_CLOCK_COUNT *= *"(?:|[1-9]/)(.*)"\s*\Z')
-
-START_REGEXES = (START_TIME_REGEX, START_SCLK_REGEX)
-STOP_REGEXES  = (STOP_TIME_REGEX,  STOP_SCLK_REGEX)
-ALT_REGEXES   = (ALT_TIME_REGEX,   ALT_SCLK_REGEX)
+START_KEYWORDS = ('START_TIME', 'SPACECRAFT_CLOCK_START_COUNT')
+STOP_KEYWORDS  = ('STOP_TIME',  'SPACECRAFT_CLOCK_STOP_COUNT')
+ALT_KEYWORDS   = ('IMAGE_TIME', 'SPACECRAFT_CLOCK_COUNT')
 
 # The arg should point to directory on a single volume containing (recursively)
 # all the data files 
 
-def get_first_values(dirpath, filenames, regexes, alt_regexes, alt2_regexes):
+def get_first_values(dirpath, filenames, keywords, alt_keywords, alt2_keywords):
     """Return the values found in the first label file of a directory.
     Filenames must be provided in the order to be searched."""
 
@@ -34,44 +30,34 @@ def get_first_values(dirpath, filenames, regexes, alt_regexes, alt2_regexes):
         if not filename.upper().endswith('.LBL'): continue
 
         first_values = get_label_values(os.path.join(dirpath, filename),
-                                        regexes, alt_regexes, alt2_regexes)
+                                        keywords, alt_keywords, alt2_keywords)
         if None not in first_values: return first_values
 
-    return len(regexes) * (None,)
+    return len(keywords) * (None,)
 
-def get_label_values(filepath, regexes, alt_regexes, alt2_regexes):
+def get_label_values(filepath, keywords, alt_keywords, alt2_keywords):
     """Return a list of values found in a label file, based on a list of
-    regular expressions.
+    keywords. A value found for an alternative keyword takes precedence.
     """
 
-    f = open(filepath)
-    recs = f.readlines()
-    f.close()
+    label = pds3_keywords.label_texts(filepath, keywords + alt_keywords +
+                                                alt2_keywords)
 
-    number_of_values = len(regexes)
+    number_of_values = len(keywords)
     values = number_of_values * [None]
 
     for k in range(number_of_values):
-        regex = regexes[k]
-        for rec in recs:
-            (value, count) = regex.subn(r'\1', rec)
-            if count == 1:
-                values[k] = value
-                break
-
-        regex = alt_regexes[k]
-        for rec in recs:
-            (value, count) = regex.subn(r'\1', rec)
-            if count == 1:
-                values[k] = value
-                break
-
-        regex = alt2_regexes[k]
-        for rec in recs:
-            (value, count) = regex.subn(r'\1', rec)
-            if count == 1:
-                values[k] = value
-                break
+        for keyword in (keywords[k], alt_keywords[k], alt2_keywords[k]):
+            if keyword not in label:
+                continue
+
+            if keyword.endswith('_TIME'):
+                match = TIME_REGEX.match(label[keyword])
+            else:
+                match = SCLK_REGEX.match(label[keyword])
+
+            if match:
+                values[k] = match.group(1)
 
         if values[-1] == 'UNK':
             values[-1] = None
@@ -121,11 +107,11 @@ for arg in sys.argv[1:]:
 
             (start_time,
              start_sclk) = get_first_values(this_dir, filenames,
-                                    START_REGEXES, STOP_REGEXES, ALT_REGEXES)
+                                    START_KEYWORDS, STOP_KEYWORDS, ALT_KEYWORDS)
             filenames.reverse()
             (stop_time,
              stop_sclk) = get_first_values(this_dir, filenames,
-                                    STOP_REGEXES, START_REGEXES, ALT_REGEXES)
+                                    STOP_KEYWORDS, START_KEYWORDS, ALT_KEYWORDS)
 
             if stop_time is None and start_time is not None:
                 stop_time = start_time
@@ -16,6 +16,7 @@ import os, sys
 import glob
 import shutil
 import pdsparser
+import pds3_keywords
 
 volume_info = {}
 data_set_info = {}
@@ -78,15 +79,18 @@ for root in sys.argv[1:]:
             pub_date = pdsdict['DATASETINFO_GROUP']['RELEASE_DATE']
 
         else:
-            pdsdict = pdsparser.PdsLabel.from_file(voldesc).as_dict()
+            values = pds3_keywords.label_values(voldesc,
+                                                ['VOLUME.DATA_SET_ID',
+                                                 'VOLUME.PUBLICATION_DATE',
+                                                 'VOLUME.VOLUME_VERSION_ID'])
 
-            dsids = pdsdict['VOLUME']['DATA_SET_ID']
+            dsids = values['VOLUME.DATA_SET_ID']
             if type(dsids) == str:
                 dsids = [dsids]
 
-            pub_date = pdsdict['VOLUME']['PUBLICATION_DATE']
+            pub_date = values['VOLUME.PUBLICATION_DATE']
 
-            version = pdsdict['VOLUME']['VOLUME_VERSION_ID']
+            version = values['VOLUME.VOLUME_VERSION_ID']
             version = float(version.split(' ')[-1])
 
             dsid_version = float(dsids[0][-3:])
@@ -10,22 +10,21 @@ import sys
 import os
 import re
 import datetime
+import pds3_keywords
 
 VOLUME_ID_REGEX  = re.compile(r'(?:|.*/)([A-Z]{2}[A-Z0-9]{0,4}_[0-9]{4})(?:|_.*|/.*)\Z')
-START_TIME_REGEX = re.compile(r'^START_TIME *= *(?:|")(....-.*T..:..:..[\.0-9]*)(|Z)(|")\s*\Z')
-STOP_TIME_REGEX  = re.compile(r'^STOP_TIME *= *(?:|")(....-.*T..:..:..[\.0-9]*)(|Z)(|")\s*\Z')
-PLANET_REGEX     = re.compile(r"^PLANET_NAME *= *'(.*)'\s*\Z")
-PI_REGEX         = re.compile(r"^HST_PI_NAME *= *'(.*)'\s*\Z")
+TIME_REGEX       = re.compile(r'^(?:|")(....-.*T..:..:..[\.0-9]*)(|Z)(|")\Z')
+QUOTED_REGEX     = re.compile(r"^'(.*)'\Z")
 
-START_REGEXES = (START_TIME_REGEX, PLANET_REGEX, PI_REGEX)
-STOP_REGEXES  = (STOP_TIME_REGEX, PLANET_REGEX, PI_REGEX)
-ALT_REGEXES   = (STOP_TIME_REGEX, PLANET_REGEX, PI_REGEX)
+START_KEYWORDS = ('START_TIME', 'PLANET_NAME', 'HST_PI_NAME')
+STOP_KEYWORDS  = ('STOP_TIME',  'PLANET_NAME', 'HST_PI_NAME')
+ALT_KEYWORDS   = ('STOP_TIME',  'PLANET_NAME', 'HST_PI_NAME')
 
 
 # The arg should point to directory on a single volume containing (recursively)
 # all the data files 
 
-def get_first_values(dirpath, filenames, regexes, alt_regexes, alt2_regexes):
+def get_first_values(dirpath, filenames, keywords, alt_keywords, alt2_keywords):
     """Return the values found in the first label file of a directory.
     Filenames must be provided in the order to be searched."""
 
@@ -33,44 +32,34 @@ def get_first_values(dirpath, filenames, regexes, alt_regexes, alt2_regexes):
         if not filename.upper().endswith('.LBL'): continue
 
         first_values = get_label_values(os.path.join(dirpath, filename),
-                                        regexes, alt_regexes, alt2_regexes)
+                                        keywords, alt_keywords, alt2_keywords)
         if None not in first_values: return first_values
 
-    return len(regexes) * (None,)
+    return len(keywords) * (None,)
 
-def get_label_values(filepath, regexes, alt_regexes, alt2_regexes):
+def get_label_values(filepath, keywords, alt_keywords, alt2_keywords):
     """Return a list of values found in a label file, based on a list of
-    regular expressions.
+    keywords. A value found for an alternative keyword takes precedence.
     """
 
-    f = open(filepath)
-    recs = f.readlines()
-    f.close()
+    label = pds3_keywords.label_texts(filepath, keywords + alt_keywords +
+                                                alt2_keywords)
 
-    number_of_values = len(regexes)
+    number_of_values = len(keywords)
     values = number_of_values * [None]
 
     for k in range(number_of_values):
-        regex = regexes[k]
-        for rec in recs:
-            (value, count) = regex.subn(r'\1', rec)
-            if count == 1:
-                values[k] = value
-                break
-
-        regex = alt_regexes[k]
-        for rec in recs:
-            (value, count) = regex.subn(r'\1', rec)
-            if count == 1:
-                values[k] = value
-                break
-
-        regex = alt2_regexes[k]
-        for rec in recs:
-            (value, count) = regex.subn(r'\1', rec)
-            if count == 1:
-                values[k] = value
-                break
+        for keyword in (keywords[k], alt_keywords[k], alt2_keywords[k]):
+            if keyword not in label:
+                continue
+
+            if keyword.endswith('_TIME'):
+                match = TIME_REGEX.match(label[keyword])
+            else:
+                match = QUOTED_REGEX.match(label[keyword])
+
+            if match:
+                values[k] = match.group(1)
 
     return values
 
@@ -123,11 +112,11 @@ for arg in sys.argv[1:]:
             filenames.sort()
             (start_time,
              planet_name, pi_name) = get_first_values(this_dir, filenames,
-                                    START_REGEXES, STOP_REGEXES, ALT_REGEXES)
+                                    START_KEYWORDS, STOP_KEYWORDS, ALT_KEYWORDS)
             filenames.reverse()
             (stop_time,
              planet_name, pi_name) = get_first_values(this_dir, filenames,
-                                    STOP_REGEXES, START_REGEXES, ALT_REGEXES)
+                                    STOP_KEYWORDS, START_KEYWORDS, ALT_KEYWORDS)
 
             if start_time is not None and start_time < start_time_min:
                 start_time_min = start_time
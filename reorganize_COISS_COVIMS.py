@@ -2,20 +2,32 @@ import os
 import sys
 import re
 import time
+from move_journal import MoveJournal, scan_files
 
 ROOT = '/Volumes/pdsdata-admin/pds4-holdings/bundles/'
+JOURNAL = 'reorganize_COISS_COVIMS.db'
+WORKERS = 16
 
 PATTERN1 = re.compile('1[0-9]{9}')
 PATTERN2 = re.compile('1[0-9]{9}_0[0-9]{2}')
 
 RENAME = True
 
+# Use "--rollback" to move every file in the journal back where it was
+
+if '--rollback' in sys.argv[1:]:
+    for (path, error) in MoveJournal(JOURNAL).rollback(WORKERS):
+        print('*** rollback failed:', path, error)
+    sys.exit(0)
+
+# Plan every move with one pass through each tree
+
+moves = []
 for inst in ('_iss', '_vims'):
   for phase in ('_cruise', '_saturn'):
     for subdir in ('/browse_raw/', '/data_raw/'):
       combo = 'cassini' + inst + phase + subdir
-      for root, dirs, files in os.walk(ROOT + combo):
-        for file in files:
+      for root, file in scan_files(ROOT + combo):
             ext = os.path.splitext(file)[1]
             if ext not in ('.xml', '.img', '.qub', '.png', '.jpg'):
                 continue
@@ -34,18 +46,17 @@ for inst in ('_iss', '_vims'):
             newpath = combo + part1 + part2 + part3 + file
             if oldpath == ROOT + newpath: continue
 
-            if RENAME:
-                for dirpath in (combo + part1,
-                                combo + part1 + part2,
-                                combo + part1 + part2 + part3):
-                    if not os.path.exists(ROOT + dirpath):
-                        print(dirpath)
-                        os.mkdir(ROOT + dirpath)
-
             print(newpath)
-            if RENAME:
-                os.rename(oldpath, ROOT + newpath)
-#                 time.sleep(0.05)
+            moves.append((oldpath, ROOT + newpath))
+
+# Record the plan, then create the directories and move the files. If this
+# run is interrupted, running it again resumes from the journal.
+
+if RENAME:
+    journal = MoveJournal(JOURNAL)
+    journal.plan(moves)
+    for (path, error) in journal.run(WORKERS):
+        print('*** move failed:', path, error)
 
 # Remove empty directories
 
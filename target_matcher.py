@@ -0,0 +1,108 @@
+################################################################################
+# target_matcher.py
+#
+# Find every one of a set of keys that appears as a substring of a string, with
+# a single regular expression scan.
+#
+# Usage:
+#   STAR_MATCHER = TargetMatcher.cached(STAR_ABBREVS.keys(),
+#                                       '/path/to/iss_star_matcher.pickle')
+#   for key in STAR_MATCHER.matches(obs_id, sequence_title):
+#       ...
+#
+# The result is the same set of keys as testing "key in text" for every key,
+# but each text is scanned once. The scan uses a zero-width alternation with
+# the longest keys first, so at each position it finds the longest key starting
+# there; every other key starting at that position is a prefix of it, and these
+# prefixes are precomputed.
+#
+# The cache file holds the keys, the pattern and the prefix table; the regular
+# expression itself cannot be pickled and is compiled again when it is loaded.
+# The cache is optional: if it cannot be written, the matcher is still returned.
+################################################################################
+
+import os
+import re
+import pickle
+import tempfile
+
+class TargetMatcher(object):
+    """Class to find all the keys that appear within a string."""
+
+    def __init__(self, keys):
+        """Construct a matcher for the given keys."""
+
+        self.keys = tuple(sorted(set(keys)))
+
+        # Longest keys first, so the alternation prefers the longest match
+        ordered = sorted(self.keys, key=lambda k: (-len(k), k))
+        self.pattern = '(?=(' + '|'.join([re.escape(k) for k in ordered]) + '))'
+
+        # For each key, every key that is a prefix of it, including itself
+        self.prefixes = {}
+        for key in self.keys:
+            self.prefixes[key] = tuple([k for k in self.keys
+                                        if key.startswith(k)])
+
+        self.regex = re.compile(self.pattern)
+
+    def __getstate__(self):
+        return (self.keys, self.pattern, self.prefixes)
+
+    def __setstate__(self, state):
+        (self.keys, self.pattern, self.prefixes) = state
+        self.regex = re.compile(self.pattern)
+
+    def matches(self, *texts):
+        """Return the set of keys found within any of the given strings."""
+
+        found = set()
+        for text in texts:
+            for match in self.regex.finditer(text):
+                found.update(self.prefixes[match.group(1)])
+
+        return found
+
+    @staticmethod
+    def cached(keys, cache_path):
+        """Return a matcher for the given keys, loading it from a pickle file
+        if the file holds a matcher for the same keys, and otherwise building
+        it and saving it there.
+
+        The file is written under a temporary name and then renamed, so other
+        processes never read a partial file. If it cannot be written, e.g.,
+        because the directory is read-only, the matcher is returned anyway.
+        """
+
+        keys = tuple(sorted(set(keys)))
+
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    matcher = pickle.load(f)
+                if matcher.keys == keys:
+                    return matcher
+            except Exception:       # an unreadable cache is rebuilt
+                pass
+
+        matcher = TargetMatcher(keys)
+
+        cache_dir = os.path.dirname(os.path.abspath(cache_path))
+        try:
+            (fd, temp_path) = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        except (IOError, OSError):
+            return matcher
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(matcher, f, protocol=2)
+            os.rename(temp_path, cache_path)
+        except (IOError, OSError):
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+        return matcher
+
+################################################################################
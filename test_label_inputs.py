@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import digest_store
+import label_inputs
+from label_inputs import LabelInputs, inputs_hash
+
+class TestLabelInputs(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.store = LabelInputs(os.path.join(self.tempdir, 'inputs.db'))
+
+        # Keep checksums out of the user's own digest store
+        self.digests = digest_store.STORE
+        self.digests_pid = digest_store.STORE_PID
+        digest_store.STORE = digest_store.DigestStore(
+                                    os.path.join(self.tempdir, 'digests.db'))
+        digest_store.STORE_PID = os.getpid()
+
+    def tearDown(self):
+        self.store.close()
+        digest_store.STORE.close()
+        digest_store.STORE = self.digests
+        digest_store.STORE_PID = self.digests_pid
+        shutil.rmtree(self.tempdir)
+
+    def write(self, name, content):
+        path = os.path.join(self.tempdir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+        return path
+
+    def test_inputs_hash(self):
+        a = self.write('a.txt', b'alpha\n')
+        b = self.write('b.txt', b'beta\n')
+
+        inputs = inputs_hash([a, b], ['x', 1])
+        self.assertEqual(inputs_hash([a, b], ['x', 1]), inputs)
+
+        # The order of files, and any file or value, changes the hash
+        self.assertNotEqual(inputs_hash([b, a], ['x', 1]), inputs)
+        self.assertNotEqual(inputs_hash([a, b], ['x', 2]), inputs)
+        self.assertNotEqual(inputs_hash([a], ['x', 1]), inputs)
+
+        # A changed file is read again
+        self.write('b.txt', b'gamma\n')
+        self.assertNotEqual(inputs_hash([a, b], ['x', 1]), inputs)
+
+    def test_save_and_is_current(self):
+        source = self.write('source.txt', b'source\n')
+        labelfile = self.write('label.xml', b'<label/>\n')
+        inputs = inputs_hash([source])
+
+        self.assertEqual(self.store.lookup(labelfile), None)
+        self.assertFalse(self.store.is_current(labelfile, inputs))
+
+        self.store.save(labelfile, inputs)
+        self.assertEqual(self.store.lookup(labelfile), inputs)
+        self.assertTrue(self.store.is_current(labelfile, inputs))
+        self.assertFalse(self.store.is_current(labelfile, inputs[::-1]))
+
+        # A saved value is replaced
+        self.store.save(labelfile, inputs[::-1])
+        self.assertTrue(self.store.is_current(labelfile, inputs[::-1]))
+        self.assertFalse(self.store.is_current(labelfile, inputs))
+
+    def test_deleted_label(self):
+        labelfile = self.write('label.xml', b'<label/>\n')
+        inputs = inputs_hash([], ['value'])
+
+        self.store.save(labelfile, inputs)
+        self.assertTrue(self.store.is_current(labelfile, inputs))
+
+        # A label that no longer exists must be written again
+        os.remove(labelfile)
+        self.assertFalse(self.store.is_current(labelfile, inputs))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,261 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+
+import pdsparser
+import pds3_keywords
+from pds3_keywords import *
+
+# Values that pdsparser accepts, written the way they appear in labels
+SCALARS = [
+    '5', '-12', '+7', '007', '99999999999999999999',
+    '1.5', '-0.0', '7.', '.5', '-.5', '1.5E3', '5.e3', '1e+3', '1.0e-3',
+    '16#FF#', '2#1010#',
+    '2.5 <km>', '-3 <KM>', '1<s>', '12.0 <DEG/S>',
+    'PDS3', 'N', 'CASSINI_ORBITER', 'X_Y_1',
+    '"CASSINI"', '"Saturn rings"', '"  padded  "', '""', '"N/A"', '"UNK"',
+    '"1/1294562651.118"', '"12-34"', '"-5"', '"123"', '"a,b"', '"it\'s"',
+    '"a /* not a comment */"', '"x (y"', '"a\\nb"', '"a\tb"',
+    "'ABC'", "'  c '", "'2005-001'",
+    '2005-001T00:00:00.000', '2005-01-01T00:00:00.000Z', '2005-001',
+    '2005-01-01', '2004-02-29T12:34:56.5', '2005-001T00:00:00.1234Z',
+    '2005-001T00:00:00.', '2005-365T23:59:59.999999', '12:30:00',
+    '"2005-01-01T00:00:00.000Z"', '"2005-001T00:00:00"', '"2005-001"',
+    '"2005-01-01T00:00"', '"2005-001T00:00:00.Z"', '"2005-001T99:00:00"',
+    '"2005-001T00:00:60.5"', '"0000-01-01T00:00:00"', '"2005-367T00:00:00"',
+    '"12:30:00Z"', '" 2005-01-01T00:00:00Z "', '"2005-01-01Z"',
+    '"2005-001T00:00:00.1234567"', '"2005-01-01T00:00:00+01:00"',
+]
+
+SEQUENCES = [
+    '(1, 2, 3)', '( 1 , 2 )', '(1.5 <km>, 2 <km>)', '(1, 2.5)',
+    '(A, B)', '("A", "B")', '("a,b", "c")', "('a', 'b')", '("A")',
+    '("2005-001T00:00:00", "x")', '(2005-001T00:00:00, 2005-002T00:00:00)',
+    '((1, 2), (3, 4))', '{1, 2}', '{"A", "B"}', '(1,\n  2,\n  3)',
+    '("A", /* comment */\n "B")',
+]
+
+OTHERS = [
+    '"Line one\n  line two"',
+    '"Multi-line text\n with 2005-001 in it\n"',
+    '5 /* trailing comment */',
+    '"x" /* comment */',
+]
+
+NAMES = ['ALPHA', 'BETA', 'GAMMA', 'DELTA', 'START_TIME', 'STOP_TIME',
+         'TARGET_NAME', 'FILTER_NAME', 'BANDS', 'LINES', 'CASSINI:FLAG']
+
+OBJECTS = ['IMAGE', 'TABLE', 'SPECTRAL_QUBE', 'BAND_BIN', 'IMAGE_HEADER']
+
+def full_values(label_text, keywords):
+    """Return the values of keywords as found by walking pdsparser's dict."""
+
+    label = pdsparser.PdsLabel.from_string(label_text).as_dict()
+    values = {}
+    for keyword in keywords:
+        value = label
+        try:
+            for name in keyword.split('.'):
+                value = value[name]
+        except (KeyError, TypeError):
+            continue
+
+        values[keyword] = value
+
+    return values
+
+def random_label(rng, depth=0, prefix=''):
+    """Return (list of lines, list of keyword paths) for a random label."""
+
+    lines = []
+    paths = []
+    names = rng.sample(NAMES, rng.randint(1, 5))
+    objects = rng.sample(OBJECTS, rng.randint(0, 2) if depth < 2 else 0)
+    indent = '  ' * depth
+
+    for name in names:
+        value = rng.choice(SCALARS + SEQUENCES + OTHERS)
+        lines.append(indent + name + ' = ' + value)
+        paths.append(prefix + name)
+
+        if rng.random() < 0.1:
+            lines.append(indent + '/* A comment line */')
+
+    for obj in objects:
+        kind = rng.choice(['OBJECT', 'GROUP'])
+        (sublines, subpaths) = random_label(rng, depth+1, prefix + obj + '.')
+        lines += [indent + kind + ' = ' + obj] + sublines
+        lines.append(indent + 'END_' + kind + ' = ' + obj)
+        paths += subpaths + [prefix + obj + '.' + kind]
+
+    return (lines, paths)
+
+class TestPds3Keywords(unittest.TestCase):
+
+    def assertMatchesParser(self, label_text, keywords):
+        try:
+            expected = full_values(label_text, keywords)
+        except Exception:
+            return          # not a valid label
+
+        values = text_values(label_text, keywords)
+        self.assertEqual(values, expected, label_text)
+
+        for keyword in values:
+            self.assertEqual(type(values[keyword]), type(expected[keyword]),
+                             keyword + ' in\n' + label_text)
+
+    def test_scalars(self):
+        for value in SCALARS + SEQUENCES + OTHERS:
+            label_text = 'PDS_VERSION_ID = PDS3\nKEY = ' + value + '\nEND\n'
+            self.assertMatchesParser(label_text, ['KEY', 'MISSING'])
+
+    def test_fast_path(self):
+        label_text = ('PDS_VERSION_ID = PDS3\n'
+                      'START_TIME = 2005-001T00:00:00.5Z\n'
+                      'TARGET_NAME = "SATURN"\n'
+                      'EXPOSURE_DURATION = 5.6 <SECOND>\n'
+                      'OBJECT = IMAGE\n'
+                      '  LINES = 1024\n'
+                      '  BANDS = (1, 2,\n'
+                      '           3)\n'
+                      'END_OBJECT = IMAGE\n'
+                      'END\n')
+        keywords = ['START_TIME', 'TARGET_NAME', 'EXPOSURE_DURATION',
+                    'IMAGE.LINES', 'IMAGE.BANDS', 'LINES']
+
+        # No full parse is needed
+        parser = pdsparser.PdsLabel
+        pdsparser.PdsLabel = None
+        try:
+            values = text_values(label_text, keywords)
+        finally:
+            pdsparser.PdsLabel = parser
+
+        self.assertEqual(values, {'START_TIME': '2005-001T00:00:00.500',
+                                  'TARGET_NAME': 'SATURN',
+                                  'EXPOSURE_DURATION': 5.6,
+                                  'IMAGE.LINES': 1024,
+                                  'IMAGE.BANDS': [1, 2, 3]})
+        self.assertMatchesParser(label_text, keywords)
+
+    def test_irregular_labels(self):
+
+        # Repeated keywords
+        label_text = 'A = 1\nA = 2\nB = 3\nEND\n'
+        self.assertMatchesParser(label_text, ['A', 'A_1', 'A_2', 'B'])
+
+        # Columns named by NAME
+        label_text = ('OBJECT = TABLE\n'
+                      '  ROWS = 5\n'
+                      '  OBJECT = COLUMN\n'
+                      '    NAME = "X"\n'
+                      '    BYTES = 4\n'
+                      '  END_OBJECT = COLUMN\n'
+                      'END_OBJECT = TABLE\n'
+                      'END\n')
+        self.assertMatchesParser(label_text, ['TABLE.ROWS', 'TABLE.X.BYTES',
+                                              'TABLE.COLUMN.BYTES'])
+
+        # Pointers
+        label_text = '^IMAGE = ("X.IMG", 3)\n^TABLE = 5\nEND\n'
+        self.assertMatchesParser(label_text, ['^IMAGE', '^TABLE'])
+
+    def test_random_labels(self):
+        rng = random.Random(42)
+        for k in range(500):
+            (lines, paths) = random_label(rng)
+            label_text = '\n'.join(['PDS_VERSION_ID = PDS3'] + lines +
+                                   ['END', ''])
+            keywords = paths + ['MISSING', 'IMAGE.MISSING']
+            self.assertMatchesParser(label_text, keywords)
+
+    def test_read_label_text(self):
+        label_text = ('PDS_VERSION_ID = PDS3\r\n'
+                      'OBJECT = IMAGE\r\n'
+                      '  LINES = 1024\r\n'
+                      'END_OBJECT = IMAGE\r\n'
+                      'END\r\n')
+        (fd, filepath) = tempfile.mkstemp()
+        os.close(fd)
+
+        chunk = pds3_keywords.LABEL_CHUNK
+        try:
+            for tail in ('', '\x00' * 100):
+                with open(filepath, 'wb') as f:
+                    f.write((label_text + tail).encode('latin-1'))
+
+                # Let a chunk end at every offset, including inside END_OBJECT
+                for k in range(1, len(label_text) + 2):
+                    pds3_keywords.LABEL_CHUNK = k
+                    self.assertEqual(read_label_text(filepath), label_text)
+
+            # A final END line need not end with a newline
+            with open(filepath, 'wb') as f:
+                f.write(label_text[:-2].encode('latin-1'))
+
+            for k in range(1, len(label_text) + 2):
+                pds3_keywords.LABEL_CHUNK = k
+                self.assertEqual(read_label_text(filepath), label_text[:-2])
+
+        finally:
+            pds3_keywords.LABEL_CHUNK = chunk
+            os.remove(filepath)
+
+    def test_label_texts(self):
+        label_text = ('PDS_VERSION_ID = PDS3\r\n'
+                      'START_TIME = 2005-001T00:00:00.1Z /* comment */\r\n'
+                      'SPACECRAFT_CLOCK_START_COUNT = "1/1467123456.118"\r\n'
+                      'PLANET_NAME = \'SATURN\'\r\n'
+                      'PLANET_NAME = \'TITAN\'\r\n'
+                      'NOTE = "Line one\r\n  line two"\r\n'
+                      'OBJECT = IMAGE\r\n'
+                      '  LINES = (1,\r\n  2)\r\n'
+                      'END_OBJECT = IMAGE\r\n'
+                      'END\r\n')
+        (fd, filepath) = tempfile.mkstemp()
+        os.close(fd)
+
+        try:
+            with open(filepath, 'wb') as f:
+                f.write(label_text.encode('latin-1'))
+
+            texts = label_texts(filepath, ['START_TIME', 'PLANET_NAME',
+                                           'SPACECRAFT_CLOCK_START_COUNT',
+                                           'NOTE', 'IMAGE.LINES', 'MISSING'])
+        finally:
+            os.remove(filepath)
+
+        self.assertEqual(texts, {'START_TIME': '2005-001T00:00:00.1Z',
+                                 'SPACECRAFT_CLOCK_START_COUNT':
+                                                        '"1/1467123456.118"',
+                                 'PLANET_NAME': "'SATURN'",
+                                 'IMAGE.LINES': '(1,   2)'})
+
+    def test_read_through_end(self):
+        header = (b'CCSD3ZF0000100000001NJPL3IF0PDS200000001 = SFDU_LABEL\r\n'
+                  b'OBJECT = QUBE\r\n'
+                  b'  AXES = 3\r\n'
+                  b'END_OBJECT = QUBE\r\n'
+                  b'END\r\n')
+
+        # Let a chunk end at every offset, including inside END_OBJECT
+        for k in range(1, len(header) + 2):
+            f = io.BytesIO(header + b'\0' * 100)
+            (buffer, end) = read_through_end(f, k)
+            self.assertEqual(buffer[:end], header)
+
+            # A final END line need not end with a newline
+            f = io.BytesIO(header[:-2])
+            (buffer, end) = read_through_end(f, k)
+            self.assertEqual(buffer[:end], header[:-2])
+
+        # A label that stops at END_OBJECT has no END line
+        f = io.BytesIO(b'OBJECT = QUBE\r\nEND_OBJECT')
+        self.assertEqual(read_through_end(f, 4), (b'OBJECT = QUBE\r\n'
+                                                  b'END_OBJECT', None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,18 @@
+################################################################################
+# xmltemplate: generate PDS4 labels from XML templates
+#
+# Usage:
+#   from xmltemplate import XmlTemplate
+#   TEMPLATE = XmlTemplate('iss_data_raw_template.xml')
+#   TEMPLATE.write(lookup, 'N1454725799_1.xml')
+#
+# This package is shared by the COISS, COUVIS and COVIMS labelers. Functions
+# needed only by one mission's templates are passed to XmlTemplate() or added
+# with register_functions(), rather than added to the package itself.
+#
+# To measure rendering throughput for each mission's templates:
+#   python -m xmltemplate.benchmark
+################################################################################
+
+from xmltemplate.template import XmlTemplate, PREDEFINED_FUNCTIONS, \
+                                 register_functions
@@ -0,0 +1,195 @@
+################################################################################
+# xmltemplate/benchmark.py
+#
+# Measure how fast each mission's templates are filled out.
+#
+# Syntax:
+#   python -m xmltemplate.benchmark [--count N] [template.xml ...]
+#
+# With no templates given, the data and browse templates of COISS, COUVIS and
+# COVIMS are used. Each template is filled out repeatedly against a synthetic
+# lookup dictionary, using both XmlTemplate.stringlist() and the generated
+# render function, and the rate is reported in labels per second.
+#
+# The synthetic lookup gives every name used by the template a placeholder
+# value that works as a string, a number or a list. Names ending in "TIME" are
+# given a date-time string, names ending in "_tai" are given a TAI value in
+# seconds, and file names refer to the template itself. The
+# FILE_* functions are cached, so the rates measure the template engine rather
+# than I/O.
+################################################################################
+
+import os, sys
+import time
+import argparse
+
+from xmltemplate import XmlTemplate, PREDEFINED_FUNCTIONS
+
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TEMPLATES = [
+    'COISS/iss_data_raw_template.xml',
+    'COUVIS/euv_fuv_data_raw_template.xml',
+    'COUVIS/hdac_data_raw_template.xml',
+    'COUVIS/hsp_data_raw_template.xml',
+    'COVIMS/vims_data_raw_template.xml',
+    'COVIMS/vims_browse_raw_template.xml',
+    'COVIMS/wavelength-bins_template.xml',
+]
+
+TIME_VALUE = '2005-01-01T00:00:00.000'
+TAI_VALUE = 157766432.
+FILE_NAMES = ('datafile', 'filename', 'basename', 'pds3_filepath')
+LOCAL_NAMES = ('VALUE', 'INDEX', 'LENGTH')
+
+################################################################################
+# Synthetic lookup dictionaries
+################################################################################
+
+class Synthetic(str):
+    """A placeholder value. It is the string "1", which converts to a number;
+    it can be indexed and iterated over like a two-item list, and arithmetic
+    on it returns a float."""
+
+    def __new__(cls):
+        return str.__new__(cls, '1')
+
+    def __getitem__(self, index):
+        return self
+
+    def __getslice__(self, i, j):       # Python 2 only
+        return self
+
+    def __iter__(self):
+        return iter([self, self])
+
+    def __len__(self):
+        return 2
+
+    def __add__(self, other):
+        if isinstance(other, str) and not isinstance(other, Synthetic):
+            return str(self) + other
+        return 1. + number(other)
+
+    def __radd__(self, other):
+        if isinstance(other, str):
+            return other + str(self)
+        return other + 1.
+
+    def __sub__(self, other):  return 1. - number(other)
+    def __rsub__(self, other): return other - 1.
+    def __mul__(self, other):  return 1. * number(other)
+    def __rmul__(self, other): return other * 1.
+    def __div__(self, other):  return 1. / number(other)
+    def __rdiv__(self, other): return other / 1.
+    def __int__(self):         return 1
+    def __float__(self):       return 1.
+    def __neg__(self):         return -1.
+    def __abs__(self):         return 1.
+
+    __truediv__ = __div__
+    __rtruediv__ = __rdiv__
+
+def number(value):
+    """Return a placeholder value as a number; leave anything else alone."""
+
+    return 1. if isinstance(value, Synthetic) else value
+
+def free_names(template):
+    """Return the set of names that a template needs from the lookup."""
+
+    names = set()
+
+    def add_names(code):
+        names.update(code.co_names)
+        for const in code.co_consts:
+            if hasattr(const, 'co_names'):
+                add_names(const)
+
+    for codes in template.codes:
+        for code in codes:
+            add_names(code)
+
+    for code in template.header_codes:
+        if code is not None:
+            add_names(code)
+
+    for assignments in template.assignments:
+        names -= set(assignments)
+
+    names -= set(PREDEFINED_FUNCTIONS)
+    names -= set(LOCAL_NAMES)
+    return set(n for n in names if not hasattr(builtins, n))
+
+def synthetic_lookup(template):
+    """Return a synthetic lookup dictionary for a template."""
+
+    lookup = {}
+    for name in free_names(template):
+        if name.endswith('TIME'):
+            lookup[name] = TIME_VALUE
+        elif name.endswith('_tai'):
+            lookup[name] = TAI_VALUE
+        elif name in FILE_NAMES:
+            lookup[name] = template.filename
+        else:
+            lookup[name] = Synthetic()
+
+    return lookup
+
+################################################################################
+# Timing
+################################################################################
+
+def labels_per_second(fill_out, template, lookup, count):
+    """Return the rate at which labels are filled out by the given method."""
+
+    fill_out(dict(lookup))              # first call fills the caches
+
+    start = time.time()
+    for k in range(count):
+        fill_out(dict(lookup))
+
+    return count / (time.time() - start)
+
+def benchmark(filename, count):
+    """Time one template and print the result."""
+
+    template = XmlTemplate(filename)
+    lookup = synthetic_lookup(template)
+
+    # The two methods must agree
+    if template.stringlist(dict(lookup)) != template.render(dict(lookup)):
+        raise ValueError('render() and stringlist() disagree: ' + filename)
+
+    rate1 = labels_per_second(template.stringlist, template, lookup, count)
+    rate2 = labels_per_second(template.render, template, lookup, count)
+
+    print('%-40s %10.1f %10.1f' % (os.path.basename(filename), rate1, rate2))
+
+################################################################################
+# Command line interface
+################################################################################
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Measure the rate at which '
+                                     'XML templates are filled out.')
+    parser.add_argument('templates', nargs='*',
+                        help='template files; default is the mission templates')
+    parser.add_argument('--count', type=int, default=1000,
+                        help='number of labels per measurement')
+    args = parser.parse_args()
+
+    templates = args.templates or [os.path.join(ROOT, t) for t in TEMPLATES]
+
+    print('%-40s %10s %10s' % ('template', 'stringlist', 'render'))
+    for filename in templates:
+        benchmark(filename, args.count)
+
+if __name__ == '__main__': main()
@@ -0,0 +1,838 @@
+################################################################################
+# xmltemplate/template.py: Class XmlTemplate
+################################################################################
+
+import os
+import types
+import string
+import time, datetime, pytz
+import julian
+import traceback
+from multiprocessing import Pool, cpu_count
+from xml.sax.saxutils import escape
+import digest_store
+
+class XmlTemplate(object):
+    """Class to generate PDS4 labels based on XML templates.
+
+    Inside the template file, everything in between "$" is interpreted as an
+    expression to be evaluated in Python that will replace this value. For
+    example, if INSTRUMENT_ID = 'ISSWA', then
+        description>$INSTRUMENT_ID$</description>
+    in the template will become
+        description>ISSNA</description>
+    in the label. The expression between "$" can include indexes, function
+    calls, or anything else that is defined inside the Python program that
+    imports this module.
+
+    The expression can also be of the form "name=expression", where the name is
+    a valid Python variable name. In this case, the variable becomes defined,
+    and it can be subsequently re-used further down in the template. For
+    example, if this appears as an expression,
+        $cruise_or_saturn=('cruise' if START_TIME < 2004 else 'saturn')$
+    then later in the template, one can write:
+        <lid_reference>
+        urn:nasa:pds:cassini_iss_$cruise_or_saturn$:data_raw:cum-index
+        </lid_reference>
+
+    The template may also contain any number of "Section" headers. These
+    begin with "$" in the first character, and they apply to the section of
+    the file starting immediately below and continuing to the next section
+    header or the end of the file. For example, this is a one-line section of
+    the template, with a "$FOR_EACH" header:
+
+    $FOR_EACH(target_alt)
+            <alternate_designation>$VALUE$</alternate_designation>
+    $ONCE
+            ...
+
+    These types of section headers are supported:
+    $ONCE:          every line of XML in this section is used exactly once.
+    $IF(e):         this section is included only if the expression e is nonzero
+                    when evaluated within the scope of the Python program.
+    $FOR_EACH(e):   this section is repeated zero or more times, once for each
+                    value of the Python expression e. Within each iteration of
+                    this section,
+                        VALUE  is replaced by each value in the list;
+                        INDEX  is replaced by each list index (0-based);
+                        LENGTH is replaced by the number of values.
+
+    It is not necessary to start the template file with a header; "$ONCE" is
+    implied. Note that these headers cannot be nested.
+
+    The following pre-defined functions can be used anywhere in a template:
+
+        REPLACE_NA(value, if_na):
+            the second argument if the value is a string "N/A";
+            otherwise, return the value.
+
+        REPLACE_UNK(value, if_unk):
+            the second argument if the value is a string "UNK";
+            otherwise, return the value.
+
+        CURRENT_ZULU():
+            the current time UTC as a string "yyyy-mm-ddThh:mm:ssZ".
+
+        DATETIME(string):
+            convert the given date/time string to a year-month-day format with a
+            trailing "Z"
+
+        DAYSECS(string):
+            the number of elapsed seconds since the beginning of the day
+
+        BASENAME(filename):
+            the basename of a file, with leading directory paths removed.
+
+        FILE_ZULU(filename):
+            the modification time of a file as a UTC string
+            "yyyy-mm-ddThh:mm:ss.sssZ".
+
+        FILE_BYTES(filename):
+            the size of a file in bytes.
+
+        FILE_RECORDS(filename):
+            the number of records in an ASCII file; 0 if the file is binary.
+
+        FILE_MD5(filepath):
+            return the MD5 checksum of the file at the specified filepath.
+
+    Note that these functions can be called from the user's Python program by
+    importing them from XmlTemplate.
+
+    Additional predefined functions, such as those needed by the templates of
+    one mission, can be provided as a dictionary when the template is
+    constructed, or registered for every template using register_functions().
+
+    All character strings are "escaped" by default, meaning that "&" is changed
+    to "&amp;", ">" is changed to "&gt;", and "<" is changed to "&lt;". If you
+    do not wish for a string to be escaped, let it begin with "NOESCAPE". If
+    this starts a string, then these eight characters are removed and the
+    remainder of the string is returned without escaping. Use this if you want
+    to generate XML using this class.
+    """
+
+    TIMEZONE = 'America/Los_Angeles'    # convert to the name of the local
+                                        # timezone as recognized by pytz. Needed
+                                        # by FILE_ZULU().
+
+    def __init__(self, filename, functions={}):
+        """Construct a PDS4 template object from the contents of a file.
+
+        Input:
+            filename    path to the template file.
+            functions   optional dictionary of additional predefined functions
+                        for this template, keyed by the name used in the
+                        template. These take precedence over the functions in
+                        PREDEFINED_FUNCTIONS. For use with write_many(), they
+                        must be defined at the top level of a module.
+        """
+
+        # Read the template
+        with open(filename) as f:
+            recs = f.readlines()
+
+        # Remove Mitch's comments; strip trailing whitespace
+        for k,rec in enumerate(recs):
+            parts = rec.split('<!-- [mkg]')
+            assert len(parts) <= 2
+            recs[k] = parts[0].rstrip() + '\r\n'
+
+        # Break up into sections, header_types, header_expressions
+        sections = [[]]
+        header_types = ['$ONCE']
+        header_expressions = ['']
+        for rec in recs:
+
+            # Handle headers
+            if rec.startswith('$'):
+                sections.append([])     # start a new section
+
+                header = rec.rstrip()
+                parts = header.partition('(')
+                assert parts[0] in ('$ONCE', '$IF', '$FOR_EACH')
+                header_types.append(parts[0])
+
+                if parts[0] == '$ONCE':
+                    assert parts[1:] == ('','')
+                    header_expressions.append(None)
+                else:
+                    assert parts[2].endswith(')')
+                    header_expressions.append(parts[2][:-1])
+
+            # Otherwise it's the next line of this section
+            else:
+                sections[-1].append(rec)
+
+        # Within each section, identify expressions to be evaluated
+        expressions = []
+        for k,section in enumerate(sections):
+            expressions.append([])
+            new_recs = []
+            for rec in section:
+                parts = rec.split('$')
+                if len(parts) % 2 != 1:
+                    print rec
+                    raise ValueError('Unmatched "$"')
+
+                # List the index of every part that needs to be evaluated
+                for j in range(1,len(parts),2):
+                    expressions[-1].append(len(new_recs) + j)
+
+                new_recs += parts
+            sections[k] = new_recs
+
+        # Identify assignments among the expressions
+        assignments = []
+        for k,section in enumerate(sections):
+            assignments.append(len(expressions[k]) * [None])
+            for jndex,j in enumerate(expressions[k]):
+                expr = section[j].strip()
+                while expr.startswith('(') and expr.endswith(')'):
+                    expr = expr[1:-1]
+
+                (varname, equals, right) = expr.partition('=')
+                if equals != '=':         continue      # no equal sign
+                if right.startswith('='): continue      # "==" is not assignment
+
+                varname = varname.strip()
+                right = right.strip()
+
+                wo_underscores = varname.replace('_','')
+                if len(wo_underscores) == 0:     continue   # no varname
+                if not wo_underscores.isalnum(): continue   # invalid varname
+                if not varname[0].isalpha():     continue   # invalid varname
+
+                # It's an assignment!
+                assignments[-1][jndex] = varname
+                section[j] = right
+
+        # Compile every expression once, so labels only need to evaluate them
+        codes = []
+        for k,section in enumerate(sections):
+            codes.append([XmlTemplate._compile(section[j], filename)
+                          for j in expressions[k]])
+
+        header_codes = []
+        for expr in header_expressions:
+            if expr:
+                header_codes.append(XmlTemplate._compile(expr, filename))
+            else:
+                header_codes.append(None)
+
+        self.filename = filename
+        self.functions = dict(functions)
+        self.sections = sections
+        self.expressions = expressions
+        self.assignments = assignments
+        self.codes = codes
+
+        self.header_types = header_types
+        self.header_expressions = header_expressions
+        self.header_codes = header_codes
+
+    @staticmethod
+    def _compile(expr, filename):
+        """Compile one expression into a code object for eval()."""
+
+        try:
+            return compile(expr.strip(), filename, 'eval')
+        except SyntaxError:
+            print 'Syntax error: ' + expr
+            raise
+
+    @staticmethod
+    def _format(result):
+        """Convert the value of an expression to the string to be inserted into
+        the label."""
+
+        # Format a float without unnecessary trailing zeros
+        if isinstance(result, float):
+            result = str(result)
+            if result.endswith('.0'):
+                result = result[:-1]
+
+        # Otherwise, convert to string and escape
+        if str(result).startswith('NOESCAPE'):
+            return str(result)[8:]
+        else:
+            return escape(str(result))
+
+    ############################################################################
+
+    def stringlist(self, lookup):
+        """Return a list of strings such that ''.join(stringlist) is the
+        filled-out template.
+
+        Input:
+            lookup      a dictionary containing all the variable names and
+                        values that will be needed to fill in the template.
+        """
+
+        return list(self.iterstrings(lookup))
+
+    def iterstrings(self, lookup):
+        """Generate the strings of the filled-out template in order, one
+        section at a time, so the full label is never held in memory.
+
+        Input:
+            lookup      a dictionary containing all the variable names and
+                        values that will be needed to fill in the template.
+        """
+
+        # Function to fill out one section of the template.
+        def fill_out_one_section(section, expressions, assignments, codes,
+                                 lookup, **more):
+            """Fill out one section of the template and return a list of
+            strings.
+
+            Inputs:
+                section         one section of the XML label as a list of
+                                strings.
+                expressions     a list of indices identifying the expressions to
+                                be evaluated in this section.
+                assignments     a list of variable names to assign to the value
+                                of associated expressions.
+                codes           a list of the compiled expressions.
+                lookup          a dictionary of variable names and their values.
+                more            a "local" dictionary of overrides.
+            """
+
+            recs = list(section)    # Copy the section so we can update in-place
+            for jndex,j in enumerate(expressions):
+
+                # Evaluate within the namespaces
+                try:
+                    result = eval(codes[jndex], lookup, more)
+                except Exception:
+                    print 'Eval failure: ' + recs[j]
+                    raise
+
+                # Apply assignment if necessary
+                varname = assignments[jndex]
+                if varname:
+                    lookup[varname] = result
+
+                recs[j] = XmlTemplate._format(result)
+
+            return recs
+
+        ### Begin active code
+
+        self._add_functions(lookup)
+
+        # Fill out the template
+        for k in range(len(self.sections)):
+            header_type = self.header_types[k]
+            header_code = self.header_codes[k]
+
+            # For a $ONCE section, just perform evaluations
+            if header_type == '$ONCE':
+                parts = fill_out_one_section(self.sections[k],
+                                             self.expressions[k],
+                                             self.assignments[k],
+                                             self.codes[k],
+                                             lookup)
+                for part in parts:
+                    yield part
+
+            # For an $IF section, first decide whether to include it
+            elif header_type == '$IF':
+                result = eval(header_code, lookup)
+                if result:
+                    parts = fill_out_one_section(self.sections[k],
+                                                 self.expressions[k],
+                                                 self.assignments[k],
+                                                 self.codes[k],
+                                                 lookup)
+                    for part in parts:
+                        yield part
+
+            # For a $FOR_EACH, make a list of the values that will be inserted
+            # and repeat for each one.
+            else:
+                results = list(eval(header_code, lookup))
+
+                # Repeat for each result
+                for j,result in enumerate(results):
+                    # The variables VALUE, INDEX, and LENGTH are local overrides
+                    # for this iteration of the loop
+                    parts = fill_out_one_section(self.sections[k],
+                                                 self.expressions[k],
+                                                 self.assignments[k],
+                                                 self.codes[k],
+                                                 lookup,
+                                                 VALUE=result,
+                                                 INDEX=j,
+                                                 LENGTH=len(results))
+                    for part in parts:
+                        yield part
+
+    def _add_functions(self, lookup):
+        """Add the predefined functions to the lookup unless they were
+        overridden or are there already."""
+
+        for functions in (self.functions, PREDEFINED_FUNCTIONS):
+            for key in functions:
+                if key not in lookup:
+                    lookup[key] = functions[key]
+
+    ############################################################################
+    # Generated render function
+    ############################################################################
+
+    def render_source(self):
+        """Return the source code of a Python generator function that fills out
+        this template.
+
+        The function yields the literal text and the value of each expression
+        directly. $IF sections become "if" statements and $FOR_EACH sections
+        become "for" loops. The function is intended to be run with the lookup
+        dictionary as its global namespace, so that names in the expressions
+        are found there and assignments are saved there. Within a loop, VALUE,
+        INDEX and LENGTH are set in the lookup and the values they had before
+        are restored afterward, so outside a loop these names refer to the
+        lookup as they do in iterstrings().
+        """
+
+        varnames = set()
+        for assignments in self.assignments:
+            varnames |= set([v for v in assignments if v])
+
+        if '$FOR_EACH' in self.header_types:
+            varnames |= set(LOOP_NAMES)
+
+        lines = ['def _render(_format, _failure, _lookup):']
+        if varnames:
+            lines.append('    global ' + ', '.join(sorted(varnames)))
+
+        # A function with nothing to yield must still be a generator
+        lines.append('    if False: yield None')
+
+        for k in range(len(self.sections)):
+            header_type = self.header_types[k]
+
+            indent = '    '
+            if header_type == '$IF':
+                lines.append(indent + '_header = ' +
+                             self.header_expressions[k].strip())
+                lines.append(indent + 'if _header:')
+                indent += '    '
+
+            elif header_type == '$FOR_EACH':
+                lines.append(indent + '_header = list(' +
+                             self.header_expressions[k].strip() + ')')
+                lines.append(indent + '_saved = [(_name, _lookup[_name]) '
+                                      'for _name in %r if _name in _lookup]'
+                                      % (LOOP_NAMES,))
+                lines.append(indent + 'try:')
+                lines.append(indent + '    LENGTH = len(_header)')
+                lines.append(indent + '    for (INDEX, VALUE) in '
+                                      'enumerate(_header):')
+                indent += '        '
+
+            body = []
+            expressions = self.expressions[k]
+            for (j,part) in enumerate(self.sections[k]):
+                if j in expressions:
+                    jndex = expressions.index(j)
+                    body.append('try:')
+                    body.append('    _value = ' + part.strip())
+                    body.append('except Exception:')
+                    body.append('    _failure(%d, %d)' % (k, j))
+                    body.append('    raise')
+
+                    varname = self.assignments[k][jndex]
+                    if varname:
+                        body.append(varname + ' = _value')
+
+                    body.append('yield _format(_value)')
+
+                elif part:
+                    body.append('yield %s' % repr(part))
+
+            if not body:
+                body = ['pass']
+
+            lines += [indent + line for line in body]
+
+            # Restore the names that the loop replaced
+            if header_type == '$FOR_EACH':
+                lines.append('    finally:')
+                lines.append('        for _name in %r:' % (LOOP_NAMES,))
+                lines.append('            _lookup.pop(_name, None)')
+                lines.append('        _lookup.update(_saved)')
+
+        lines.append('')
+        return '\n'.join(lines)
+
+    def render_function(self):
+        """Return the code object of the generated render function. It is
+        generated once for each template file."""
+
+        key = os.path.abspath(self.filename)
+        if key not in RENDER_CODE_CACHE:
+            namespace = {}
+            source = self.render_source()
+            exec compile(source, '<render %s>' % self.filename,
+                         'exec') in namespace
+            RENDER_CODE_CACHE[key] = namespace['_render'].__code__
+
+        return RENDER_CODE_CACHE[key]
+
+    def iterrender(self, lookup):
+        """Generate the strings of the filled-out template in order, using the
+        generated render function, so the full label is never held in memory.
+        The strings are the same as those of iterstrings().
+
+        Input:
+            lookup      a dictionary containing all the variable names and
+                        values that will be needed to fill in the template.
+        """
+
+        self._add_functions(lookup)
+
+        # Names not found in the lookup are looked up among the builtins, as
+        # they are by eval()
+        if '__builtins__' not in lookup:
+            lookup['__builtins__'] = __builtins__
+
+        def failure(k, j):
+            print 'Eval failure: ' + self.sections[k][j]
+
+        function = types.FunctionType(self.render_function(), lookup)
+        return function(XmlTemplate._format, failure, lookup)
+
+    def render(self, lookup):
+        """Return a list of strings such that ''.join(stringlist) is the
+        filled-out template. This produces the same result as stringlist(), but
+        using the generated render function.
+
+        Input:
+            lookup      a dictionary containing all the variable names and
+                        values that will be needed to fill in the template.
+        """
+
+        return list(self.iterrender(lookup))
+
+    ############################################################################
+
+    def write(self, lookup, outfile):
+        """Write one XML label based on the template, lookup dictionary, and
+        output filename.
+
+        The label is streamed from the generated render function through a
+        buffered file as it is filled out, so the full label is never held in
+        memory. It is written to a temporary file first, which is renamed only
+        when the label is complete, so a failure never leaves a partial label
+        behind.
+        """
+
+        tempfile = outfile + '.tmp'
+        try:
+            with open(tempfile, 'w', WRITE_BUFSIZE) as f:
+                f.writelines(self.iterrender(lookup))
+        except Exception:
+            if os.path.exists(tempfile):
+                os.remove(tempfile)
+            raise
+
+        os.rename(tempfile, outfile)
+
+    def write_many(self, items, workers=None, chunksize=8):
+        """Write many XML labels based on this template, using a pool of worker
+        processes.
+
+        Only the template's file path is sent to the workers; each worker
+        reads and compiles the template once, and then writes labels
+        independently. Assignments made within the template are not returned
+        to the lookup dictionaries of the caller.
+
+        Input:
+            items       an iterable of (lookup, outfile) tuples.
+            workers     number of worker processes; default is the number of
+                        CPUs. Use 1 to write the labels in this process.
+            chunksize   number of labels sent to a worker at a time.
+
+        Return:         a list of (outfile, error) tuples in the order of the
+                        items, where error is None if the label was written
+                        successfully and is otherwise the formatted traceback.
+        """
+
+        if workers is None:
+            workers = cpu_count()
+
+        if workers == 1:
+            return [_write_one(item, self) for item in items]
+
+        # Functions added to the lookups by an earlier fill-out are not sent
+        items = [(self._portable(lookup), outfile)
+                 for (lookup, outfile) in items]
+
+        pool = Pool(workers, _init_worker, (os.path.abspath(self.filename),
+                                            self.functions))
+        try:
+            results = pool.map(_write_one, items, chunksize=chunksize)
+        except BaseException:
+            pool.terminate()
+            pool.join()
+            raise
+
+        pool.close()
+        pool.join()
+        return results
+
+    def _portable(self, lookup):
+        """Return a lookup dictionary without the predefined functions and
+        builtins, which the workers restore for themselves."""
+
+        def added(key, value):
+            for functions in (self.functions, PREDEFINED_FUNCTIONS):
+                if key in functions and value is functions[key]:
+                    return True
+            return key == '__builtins__'
+
+        return {k:v for (k,v) in lookup.items() if not added(k,v)}
+
+    ############################################################################
+    # Utility functions
+    ############################################################################
+
+    @staticmethod
+    def REPLACE_NA(value, na_value, flag='N/A'):
+        """Replace a string with the value 'N/A' with a numeric."""
+
+        if isinstance(value, str):
+            value = value.strip()
+
+        if value == flag:
+            return na_value
+        else:
+            return value
+
+    @staticmethod
+    def REPLACE_UNK(value, unk_value):
+        """Replace a string with the value 'UNK' with a numeric."""
+
+        return XmlTemplate.REPLACE_NA(value, unk_value, 'UNK')
+
+    @staticmethod
+    def CURRENT_ZULU():
+        """Return the current time UTC as a formatted string."""
+
+        return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+    @staticmethod
+    def DATETIME(value, offset=0):
+        """Convert the given date/time string to a year-month-day format with a
+        trailing "Z". The date can be in year-month-day or year-dayofyear
+        format. The time component (following a capital 'T') is unchanged. If
+        the value is "UNK", then "UNK" is returned."""
+
+        if isinstance(value, float):
+            return julian.ymdhms_format_from_tai(value + offset, 'T', 3, 'Z')
+
+        if value.strip() == 'UNK': return 'UNK'
+
+        (date,hms) = value.split('T')     # fails if not exactly two parts
+        parts = date.split('-')
+        if len(parts) == 3 and offset == 0:
+            return date + 'T' + hms + ('Z' if not hms.endswith('Z') else '')
+
+        if len(parts) == 2 and offset == 0:
+            # Note that strftime does not support dates before 1900. Some
+            # erroneous dates in some labels have erroneous years. This is a
+            # workaround.
+            day = time.strptime('19' + date[2:], '%Y-%j')
+            date = parts[0][:2] + time.strftime('%Y-%m-%d', day)[2:]
+
+            return date + 'T' + hms + ('Z' if not hms.endswith('Z') else '')
+
+        tai = julian.tai_from_iso(value) + offset
+        parts = value.split('.')
+        digits = len(parts[-1]) if len(parts) > 1 else 0
+        return julian.ymdhms_format_from_tai(tai, 'T', digits, 'Z')
+
+    @staticmethod
+    def DAYSECS(value):
+        """The number of elapsed seconds after the beginning of the day."""
+
+        if isinstance(value, float):
+            (day, secs) = julian.day_sec_from_tai(value)
+            return secs
+
+        if value.strip() == 'UNK': return 'UNK'
+
+        (date,hms) = value.split('T')     # fails if not exactly two parts
+        (h,m,s) = hms.split(':')
+        return 3600.*int(h) + 60.*int(m) + float(s)
+
+    ############################################################################
+    # Info about a file
+    ############################################################################
+
+    @staticmethod
+    def BASENAME(filename):
+        """Return the basename of a file path."""
+
+        return os.path.basename(filename)
+
+    @staticmethod
+    def FILE_ZULU(filename):
+        """Return the modification time of a file as a formatted string."""
+
+        info = XmlTemplate._file_info(filename)
+        if 'zulu' not in info:
+            timestamp = info['mtime']
+            creation_dt = datetime.datetime.fromtimestamp(timestamp)
+            local = pytz.timezone(XmlTemplate.TIMEZONE)
+            local_dt = local.localize(creation_dt, is_dst=None)
+            utc_dt = local_dt.astimezone(pytz.utc)
+            info['zulu'] = utc_dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        return info['zulu']
+
+    @staticmethod
+    def FILE_BYTES(filename):
+        """Return the number of bytes in a file."""
+
+        return XmlTemplate._file_info(filename)['bytes']
+
+    @staticmethod
+    def FILE_RECORDS(filename):
+        """Return the number of records in a file; 0 if the file is binary."""
+
+        info = XmlTemplate._file_info(filename, contents=True)
+        if info['non_asciis'] > 0.05 * info['asciis']:
+            return 0
+
+        return info['records']
+
+    @staticmethod
+    def FILE_MD5(filename, blocksize=65536):
+        """Return the MD5 checksum of the file at the specified path. A
+        checksum saved in the digest store is used if the file is unchanged."""
+
+        info = XmlTemplate._file_info(filename)
+        if 'md5' not in info:
+            md5 = digest_store.lookup(filename)
+            if md5:
+                info['md5'] = md5
+
+        if 'md5' not in info:
+            info = XmlTemplate._file_info(filename, contents=True,
+                                          blocksize=blocksize)
+
+        return info['md5']
+
+    @staticmethod
+    def _file_info(filename, contents=False, blocksize=65536):
+        """Return the cached dictionary of information about a file.
+
+        The cache is keyed by the file's path, size and modification time, so
+        a file that changes is examined again. If contents is True, the file
+        is read once to obtain its MD5 checksum, its number of records, and
+        its counts of printable and non-printable characters.
+        """
+
+        stat = os.stat(filename)
+        mtime_ns = getattr(stat, 'st_mtime_ns', int(stat.st_mtime * 1.e9))
+        key = (os.path.abspath(filename), stat.st_size, mtime_ns)
+
+        try:
+            info = FILE_INFO_CACHE[key]
+        except KeyError:
+            if len(FILE_INFO_CACHE) >= FILE_INFO_CACHE_SIZE:
+                FILE_INFO_CACHE.clear()
+
+            info = {'bytes': stat.st_size, 'mtime': stat.st_mtime}
+            FILE_INFO_CACHE[key] = info
+
+        if contents and 'records' not in info:
+            counts = {'newlines': 0, 'non_asciis': 0, 'last': b''}
+
+            def visit(buf):
+                counts['newlines'] += buf.count(b'\n')
+                counts['non_asciis'] += len(buf.translate(None,
+                                                          PRINTABLE_BYTES))
+                counts['last'] = buf[-1:]
+
+            md5 = digest_store.file_md5(filename, blocksize, visit)
+
+            # A final record need not end with a newline
+            records = counts['newlines'] + (1 if counts['last'] not in
+                                                 (b'', b'\n') else 0)
+
+            info['md5'] = md5
+            info['records'] = records
+            info['asciis'] = stat.st_size - counts['non_asciis']
+            info['non_asciis'] = counts['non_asciis']
+
+            digest_store.save(filename, md5)
+
+        return info
+
+################################################################################
+
+# Information about files used by the FILE_* functions
+FILE_INFO_CACHE = {}
+FILE_INFO_CACHE_SIZE = 1000
+PRINTABLE_BYTES = string.printable.encode('ascii')
+
+# Buffer size for writing labels
+WRITE_BUFSIZE = 65536
+
+# Code objects of generated render functions, keyed by template file path
+RENDER_CODE_CACHE = {}
+
+# Local overrides within each iteration of a $FOR_EACH section
+LOOP_NAMES = ('VALUE', 'INDEX', 'LENGTH')
+
+################################################################################
+# Worker functions for XmlTemplate.write_many()
+################################################################################
+
+WORKER_TEMPLATE = None
+
+def _init_worker(filename, functions={}):
+    """Read and compile the template once in each worker process."""
+
+    global WORKER_TEMPLATE
+
+    if WORKER_TEMPLATE is None or WORKER_TEMPLATE.filename != filename:
+        WORKER_TEMPLATE = XmlTemplate(filename, functions)
+
+def _write_one(item, template=None):
+    """Write one label; return (outfile, None) or (outfile, traceback)."""
+
+    template = template or WORKER_TEMPLATE
+
+    (lookup, outfile) = item
+    try:
+        template.write(lookup, outfile)
+    except Exception:
+        return (outfile, traceback.format_exc())
+
+    return (outfile, None)
+
+################################################################################
+
+PREDEFINED_FUNCTIONS = {}
+PREDEFINED_FUNCTIONS['REPLACE_NA'  ] = XmlTemplate.REPLACE_NA
+PREDEFINED_FUNCTIONS['REPLACE_UNK' ] = XmlTemplate.REPLACE_UNK
+PREDEFINED_FUNCTIONS['CURRENT_ZULU'] = XmlTemplate.CURRENT_ZULU
+PREDEFINED_FUNCTIONS['DATETIME'    ] = XmlTemplate.DATETIME
+PREDEFINED_FUNCTIONS['DAYSECS'     ] = XmlTemplate.DAYSECS
+PREDEFINED_FUNCTIONS['BASENAME'    ] = XmlTemplate.BASENAME
+PREDEFINED_FUNCTIONS['FILE_ZULU'   ] = XmlTemplate.FILE_ZULU
+PREDEFINED_FUNCTIONS['FILE_BYTES'  ] = XmlTemplate.FILE_BYTES
+PREDEFINED_FUNCTIONS['FILE_RECORDS'] = XmlTemplate.FILE_RECORDS
+PREDEFINED_FUNCTIONS['FILE_MD5'    ] = XmlTemplate.FILE_MD5
+
+def register_functions(functions):
+    """Add a dictionary of functions to the predefined functions available to
+    every template. A function registered under the name of an existing one
+    replaces it."""
+
+    PREDEFINED_FUNCTIONS.update(functions)
+
+################################################################################